@@ -0,0 +1,510 @@
+from Imports import *
+from VectorIndex import ExactIndex, IVFIndex, normalize
+from CSVParser import CSVParser
+from LexicalIndex import reciprocal_rank_fusion
+from FakeOllama import FakeOllama, hashed_embedding
+from OllamaClient import OllamaClient
+from Engine import Engine
+from EmbeddingStore import EmbeddingStore
+from Profiler import Profiler
+from ResponseCache import ResponseCache
+from Snapshot import snapshot_files
+
+# Metrics compared between runs, and whether lower values are better
+METRICS = {
+    'p50_ms': True, 'p95_ms': True, 'p99_ms': True, 'peak_mb': True, 'ms_per_query': True,
+    'per_s': False, 'qps': False, 'recall': False, 'hit_rate': False, 'speedup': False,
+    'tokens': True, 'tokens_per_row': True, 'vector_hit_rate': False, 'hybrid_hit_rate': False,
+}
+
+
+def clustered_vectors(n, dim, clusters=256, spread=0.35, seed=0):
+    """Synthetic embeddings grouped around random centres, like real chunk embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32) * spread
+    return normalize(centres[labels] + noise)
+
+
+def timed_search(index, queries, k, **params):
+    start = time.perf_counter()
+    results = [index.search(q, k, **params)[0] for q in queries]
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def benchmark_ann(n=200000, dim=256, queries=200, k=10, nlist=None, nprobes=(1, 4, 8, 16, 32), seed=0):
+    """Recall@k and queries/sec of the IVF index against the exact scan"""
+    vectors = clustered_vectors(n, dim, seed=seed)
+    query_vectors = clustered_vectors(queries, dim, seed=seed + 1)
+
+    exact = ExactIndex().build(vectors)
+    truth, exact_time = timed_search(exact, query_vectors, k)
+    results = [{
+        'benchmark': 'ann', 'index': 'exact', 'n': n, 'dim': dim, 'k': k,
+        'recall': 1.0, 'qps': queries / exact_time
+    }]
+
+    start = time.perf_counter()
+    ivf = IVFIndex(nlist=nlist, seed=seed).build(vectors)
+    build_time = time.perf_counter() - start
+
+    for nprobe in nprobes:
+        found, elapsed = timed_search(ivf, query_vectors, k, nprobe=nprobe)
+        recall = np.mean([len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)])
+        results.append({
+            'benchmark': 'ann', 'index': 'ivf', 'n': n, 'dim': dim, 'k': k,
+            'nlist': ivf.nlist, 'nprobe': nprobe, 'build_s': build_time,
+            'recall': float(recall), 'qps': queries / elapsed
+        })
+    return results
+
+
+def write_catalog_csv(path, rows, seed=0):
+    """Synthetic product table with unique SKUs, for exact-match retrieval tests"""
+    rng = np.random.default_rng(seed)
+    categories = ['toys', 'books', 'garden', 'kitchen', 'sports', 'office']
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sku', 'category', 'price', 'stock'])
+        for i in range(rows):
+            writer.writerow([f"SKU-{100000 + i}", categories[rng.integers(len(categories))],
+                             f"{rng.uniform(1, 500):.2f}", int(rng.integers(0, 1000))])
+
+
+def benchmark_retrieval(rows=20000, queries=200, k=3, dim=256, seed=0):
+    """Hit@k and latency of vector, BM25 and hybrid retrieval for SKU lookups"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.csv")
+        write_catalog_csv(path, rows, seed)
+        data = CSVParser(path)
+        data.create_chunks()
+
+    vectors = normalize(np.array([hashed_embedding(chunk, dim) for chunk in data.chunks]))
+    index = ExactIndex().build(vectors)
+    rng = np.random.default_rng(seed + 1)
+    targets = rng.integers(0, rows, queries)
+    questions = [f"What is the price and stock of SKU-{100000 + t}?" for t in targets]
+    expected = [1 + t // data.chunk_size for t in targets]
+
+    def vector_search(question):
+        return index.search(normalize(hashed_embedding(question, dim)), k)[0].tolist()
+
+    def lexical_search(question):
+        return data.lexical.search(question, k)[0].tolist()
+
+    def hybrid_search(question):
+        exact = data.lexical.exact_matches(question, max_docs=k)
+        if exact:
+            return exact
+        return reciprocal_rank_fusion([vector_search(question), lexical_search(question)])[:k]
+
+    results = []
+    for mode, search in (('vector', vector_search), ('bm25', lexical_search), ('hybrid', hybrid_search)):
+        start = time.perf_counter()
+        found = [search(q) for q in questions]
+        elapsed = time.perf_counter() - start
+        hits = np.mean([e in f for e, f in zip(expected, found)])
+        results.append({
+            'benchmark': 'retrieval', 'mode': mode, 'rows': rows, 'chunks': len(data.chunks),
+            'k': k, 'hit_rate': float(hits), 'ms_per_query': 1000 * elapsed / queries
+        })
+    return results
+
+
+def write_synthetic_csv(path, rows, columns=8, seed=0, null_rate=0.01, block=10000):
+    """Synthetic table of the given size and width: int, float, category and text columns in rotation"""
+    rng = np.random.default_rng(seed)
+    kinds = ['int', 'float', 'category', 'text']
+    headers = [f"{kinds[i % len(kinds)]}_{i}" for i in range(columns)]
+    categories = np.array([f"cat_{i}" for i in range(50)])
+    words = np.array("alpha beta gamma delta epsilon zeta eta theta iota kappa lambda omicron sigma omega".split())
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for start in range(0, rows, block):
+            n = min(block, rows - start)
+            values = []
+            for header in headers:
+                kind = header.split('_')[0]
+                if kind == 'int':
+                    column = rng.integers(0, 100000, n).astype(str)
+                elif kind == 'float':
+                    column = np.char.mod("%.3f", rng.normal(100, 25, n))
+                elif kind == 'category':
+                    column = categories[rng.integers(0, len(categories), n)]
+                else:
+                    picks = words[rng.integers(0, len(words), (n, 4))]
+                    column = np.array([" ".join(p) for p in picks])
+                column = column.astype(object)
+                column[rng.random(n) < null_rate] = ""
+                values.append(column)
+            writer.writerows(zip(*values))
+    return headers
+
+
+def latency_stats(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def peak_memory(fn):
+    """Peak traced allocation in MB while fn runs, and its result"""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20, result
+
+
+def measure(fn, repeat=3, setup=None):
+    """Time fn over repeat runs, then measure its peak memory in one more run
+
+    Memory is traced separately because tracemalloc slows the code it watches.
+    Returns (latency and peak_mb stats, result of the last run).
+    """
+    seconds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    peak, result = peak_memory(fn)
+    return dict(latency_stats(seconds), peak_mb=peak), result
+
+
+def benchmark_pipeline(rows=100000, columns=8, repeat=3, queries=200, dim=256, workers=4, stream=False, seed=0):
+    """Throughput, latency percentiles and peak memory of load, stats, chunking, embedding and retrieval
+
+    Embeddings come from an in-process FakeOllama over loopback, so no model server is needed
+    and results are deterministic.
+    """
+    results = []
+    fake = FakeOllama(dim=dim).start()
+    OllamaClient.configure(endpoints=[fake.address], max_concurrency=max(8, workers))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "synthetic.csv")
+            headers = write_synthetic_csv(path, rows, columns, seed)
+            size_mb = os.path.getsize(path) / 2 ** 20
+            common = {'benchmark': 'pipeline', 'rows': rows, 'columns': columns, 'stream': stream}
+
+            def record(stage, stats, items):
+                per_s = items / (stats['p50_ms'] / 1000) if stats['p50_ms'] else float('inf')
+                results.append(dict(common, stage=stage, items=items, per_s=per_s, **stats))
+
+            stats, data = measure(lambda: CSVParser(path, stream=stream), repeat)
+            record('load', stats, rows)
+            results[-1]['mb_per_s'] = size_mb / (stats['p50_ms'] / 1000)
+
+            numeric = data.get_numeric_columns()
+            stats, _ = measure(
+                lambda: [data.get_stats(col) for col in numeric], repeat,
+                setup=lambda: data.table.stats_cache.clear() if data.table is not None else None
+            )
+            record('stats', stats, rows * len(numeric))
+
+            stats, chunk_count = measure(lambda: data.create_chunks(), repeat)
+            record('chunk', stats, chunk_count)
+
+            stats, _ = measure(lambda: data.generate_embeddings('fake-embed', workers=workers), repeat)
+            record('embed', stats, chunk_count)
+
+            # Queries mix identifiers, category values and free-text words from the data
+            rng = np.random.default_rng(seed + 1)
+            sample = data.to_dict(limit=1000)
+            questions = []
+            for _ in range(queries):
+                row = sample[rng.integers(len(sample))]
+                header = headers[rng.integers(len(headers))]
+                questions.append(f"Which rows have {header} {row[header]}?")
+
+            seconds = []
+            for question in questions:
+                start = time.perf_counter()
+                data.find_relevant_chunks(question, 'fake-embed', top_k=3)
+                seconds.append(time.perf_counter() - start)
+            peak, _ = peak_memory(lambda: [data.find_relevant_chunks(q, 'fake-embed', top_k=3) for q in questions[:20]])
+            stats = dict(latency_stats(seconds), peak_mb=peak)
+            results.append(dict(common, stage='retrieve', items=queries, qps=queries / sum(seconds), **stats))
+    finally:
+        fake.stop()
+    return results
+
+
+def chunk_row_starts(chunks):
+    """First row (0-based) of each chunk, parsed from its "Rows a to b:" label; -1 for the metadata chunk"""
+    return [int(chunk.split(None, 2)[1]) - 1 if chunk.startswith("Rows ") else -1 for chunk in chunks]
+
+
+def benchmark_encoding(rows=20000, columns=8, chunk_tokens=384, chunk_size=10, queries=200, k=3, dim=256,
+                       workers=4, seed=0):
+    """Tokens, embedding throughput and retrieval hit rate of each chunk encoding
+
+    Every encoding is run with fixed chunk_size rows and with a chunk_tokens budget.
+    Queries name an int and a text value of one row; a hit means the chunk holding
+    that row is among the top k. Tokens are estimated at 4 characters each.
+    """
+    results = []
+    fake = FakeOllama(dim=dim).start()
+    OllamaClient.configure(endpoints=[fake.address], max_concurrency=max(8, workers))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "synthetic.csv")
+            headers = write_synthetic_csv(path, rows, columns, seed, null_rate=0)
+            data = CSVParser(path)
+
+        rng = np.random.default_rng(seed + 1)
+        targets = rng.integers(0, rows, queries)
+        sample = [data.get_rows(int(t), 1)[0] for t in targets]
+        int_col = next(i for i, h in enumerate(headers) if h.startswith('int'))
+        text_col = next(i for i, h in enumerate(headers) if h.startswith('text'))
+        questions = [
+            f"Which row has {headers[int_col]} {row[int_col]} and {headers[text_col]} {row[text_col]}?"
+            for row in sample
+        ]
+
+        for encoding in CSVParser.CHUNK_ENCODINGS:
+            for size, tokens in ((chunk_size, None), (None, chunk_tokens)):
+                start = time.perf_counter()
+                data.create_chunks(size, tokens, encoding)
+                chunk_seconds = time.perf_counter() - start
+                chars = sum(len(chunk) for chunk in data.chunks)
+
+                start = time.perf_counter()
+                data.generate_embeddings('fake-embed', workers=workers)
+                embed_seconds = time.perf_counter() - start
+
+                # Chunk 0 is the metadata chunk, so row chunk i is data.chunks[i + 1]
+                row_starts = chunk_row_starts(data.chunks)[1:]
+                expected = [bisect.bisect_right(row_starts, int(t)) for t in targets]
+                result = {
+                    'benchmark': 'encoding', 'encoding': encoding, 'rows': rows, 'columns': columns,
+                    'chunk_size': size, 'chunk_tokens': tokens, 'chunks': len(data.chunks),
+                    'tokens': chars // 4, 'tokens_per_row': chars / 4 / rows,
+                    'chunk_ms': 1000 * chunk_seconds, 'per_s': rows / embed_seconds,
+                }
+                positions = {chunk: i for i, chunk in enumerate(data.chunks)}
+                for mode, hybrid in (('vector', False), ('hybrid', True)):
+                    found = [data.find_relevant_chunks(q, 'fake-embed', top_k=k, hybrid=hybrid) for q in questions]
+                    hits = [e in [positions[c] for c in f] for e, f in zip(expected, found)]
+                    result[f'{mode}_hit_rate'] = float(np.mean(hits))
+                    # Context the chat prompt would carry for the retrieved chunks
+                    result[f'{mode}_context_tokens'] = float(np.mean([sum(len(c) for c in f) / 4 for f in found]))
+                results.append(result)
+    finally:
+        fake.stop()
+    return results
+
+
+class ParallelParser(CSVParser):
+    PARALLEL_THRESHOLD_BYTES = 0  # use the process pool whenever workers > 1, whatever the file size
+
+
+def benchmark_parse(rows=1000000, columns=8, workers=(1, 4, 16), repeat=3, stream=False, seed=0):
+    """Load throughput of the single-process parser (1 worker) against the process pool"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.csv")
+        write_synthetic_csv(path, rows, columns, seed)
+        size_mb = os.path.getsize(path) / 2 ** 20
+        baseline = None
+        for count in workers:
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ParallelParser(path, stream=stream, workers=count)
+                seconds.append(time.perf_counter() - start)
+            stats = latency_stats(seconds)
+            elapsed = stats['p50_ms'] / 1000
+            baseline = baseline or elapsed
+            results.append(dict(
+                benchmark='parse', rows=rows, columns=columns, stream=stream, workers=count, size_mb=size_mb,
+                per_s=rows / elapsed, mb_per_s=size_mb / elapsed, speedup=baseline / elapsed, **stats
+            ))
+    return results
+
+
+STARTUP_MODULES = ('Engine', 'cli', 'Summarizer')
+
+
+def import_seconds(module):
+    """Time to import module in a fresh interpreter"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return float(output.split()[-1])
+
+
+def benchmark_startup(rows=100000, columns=8, repeat=3, dim=256, workers=4, seed=0):
+    """Cold-start import times, then opening a file for the first time against reopening it
+
+    'cold_open' parses, profiles, chunks and embeds with empty caches and writes the
+    session snapshot; 'warm_open' reopens the file from that snapshot, also with
+    empty caches, so the difference is the snapshot alone.
+    """
+    results = []
+    for module in STARTUP_MODULES:
+        try:
+            seconds = [import_seconds(module) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"Skipping {module}: {e.stderr.strip().splitlines()[-1]}", file=sys.stderr)
+            continue
+        results.append(dict(benchmark='startup', stage='import', module=module, **latency_stats(seconds)))
+
+    fake = FakeOllama(dim=dim).start()
+    OllamaClient.configure(endpoints=[fake.address], max_concurrency=max(8, workers))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "synthetic.csv")
+            write_synthetic_csv(path, rows, columns, seed)
+            common = {'benchmark': 'startup', 'rows': rows, 'columns': columns}
+            engines = []
+
+            def fresh_engine(remove_snapshot):
+                cache = tempfile.mkdtemp(dir=tmp)
+                engine = Engine(
+                    embedding_model='fake-embed', embed_workers=workers,
+                    store=EmbeddingStore('fake-embed', cache_dir=cache), profiler=Profiler(cache_dir=cache),
+                    response_cache=ResponseCache(cache_dir=cache)
+                )
+                if remove_snapshot:
+                    for snapshot in snapshot_files(engine.snapshot_path(path)):
+                        os.remove(snapshot)
+                engines.append(engine)
+
+            def open_file():
+                # What the app does on open: load, summarize, and index unless the snapshot had it
+                engine = engines[-1]
+                data = engine.load(path)
+                engine.basic_summary(data, os.path.basename(path))
+                if not (data.restored and engine.restore_index(data)):
+                    engine.index(data)
+                    engine.save_snapshot(data)
+                return data
+
+            cold, data = measure(open_file, repeat, setup=lambda: fresh_engine(True))
+            results.append(dict(common, stage='cold_open', chunks=len(data.chunks), **cold))
+            warm, data = measure(open_file, repeat, setup=lambda: fresh_engine(False))
+            snapshot_mb = os.path.getsize(snapshot_files(engines[-1].snapshot_path(path))[0]) / 2 ** 20
+            results.append(dict(
+                common, stage='warm_open', restored=data.restored, snapshot_mb=snapshot_mb,
+                speedup=cold['p50_ms'] / warm['p50_ms'], **warm
+            ))
+    finally:
+        fake.stop()
+    return results
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        commit = ""
+    import platform
+    return {
+        'commit': commit, 'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(),
+        'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count(),
+    }
+
+
+def result_key(result):
+    """Fields that identify a measurement (everything that is not a metric)"""
+    return tuple(sorted(
+        (name, value) for name, value in result.items()
+        if name not in METRICS and not isinstance(value, float)
+    ))
+
+
+def compare_results(baseline, current, threshold=0.10):
+    """Metrics that got worse than baseline by more than threshold (a fraction)"""
+    previous = {result_key(r): r for r in baseline}
+    regressions = []
+    for result in current:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        for metric, lower_is_better in METRICS.items():
+            if metric not in result or metric not in old or not old[metric]:
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if (change > threshold) if lower_is_better else (change < -threshold):
+                regressions.append({
+                    'key': dict(result_key(result)), 'metric': metric,
+                    'baseline': old[metric], 'current': result[metric], 'change': change
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document Summarizer performance benchmarks")
+    parser.add_argument('benchmark', nargs='?', choices=['ann', 'retrieval', 'pipeline', 'parse', 'encoding', 'startup'], default='ann')
+    parser.add_argument('--rows', type=int, default=200000, help="number of vectors (ann) or CSV rows")
+    parser.add_argument('--columns', type=int, default=8, help="CSV width for pipeline")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per pipeline stage")
+    parser.add_argument('--workers', type=int, default=4, help="embedding workers for pipeline")
+    parser.add_argument('--stream', action='store_true', help="load in streaming mode for pipeline and parse")
+    parser.add_argument('--parse-workers', type=int, nargs='+', default=[1, 4, 16], help="process counts for parse")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="also write {'meta', 'results'} JSON to this file")
+    parser.add_argument('--compare', help="results JSON from an earlier run; exit 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument('--chunk-tokens', type=int, default=384, help="token budget per chunk for encoding")
+    parser.add_argument('--chunk-size', type=int, default=10, help="fixed rows per chunk for encoding")
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.benchmark == 'ann':
+        results = benchmark_ann(args.rows, args.dim, args.queries, args.k, args.nlist, args.nprobe, args.seed)
+    elif args.benchmark == 'encoding':
+        results = benchmark_encoding(args.rows, args.columns, args.chunk_tokens, args.chunk_size, args.queries,
+                                     args.k, args.dim, args.workers, args.seed)
+    elif args.benchmark == 'parse':
+        results = benchmark_parse(args.rows, args.columns, args.parse_workers, args.repeat, args.stream, args.seed)
+    elif args.benchmark == 'startup':
+        results = benchmark_startup(args.rows, args.columns, args.repeat, args.dim, args.workers, args.seed)
+    elif args.benchmark == 'retrieval':
+        results = benchmark_retrieval(args.rows, args.queries, args.k, args.dim, args.seed)
+    else:
+        results = benchmark_pipeline(args.rows, args.columns, args.repeat, args.queries, args.dim,
+                                     args.workers, args.stream, args.seed)
+    for result in results:
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'meta': run_metadata(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_results(baseline, results, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['key']} {regression['metric']}: "
+                  f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['change']:+.0%})",
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,93 +1,721 @@
 from Imports import *
+from ColumnTable import ColumnTable
+from VectorIndex import create_index, index_from_snapshot, normalize, top_k_indices
+from LexicalIndex import LexicalIndex, reciprocal_rank_fusion
+from RowIndex import RowIndex
+from ParallelCSV import load_parallel
+from OllamaClient import OllamaClient
+from Metrics import metrics
+from Snapshot import put_strings, get_strings, prefixed, unprefixed
 
 class CSVParser:
     """CSV parser with embedding support"""
-    def __init__(self, filepath):
+    STREAM_THRESHOLD_BYTES = 256 * 1024 * 1024
+    PARALLEL_THRESHOLD_BYTES = 64 * 1024 * 1024  # smaller files parse faster than a process pool starts
+    CHUNK_ENCODINGS = ('json', 'csv', 'tsv', 'columns')
+    CHARS_PER_TOKEN = 4
+    
+    def __init__(self, filepath, stream=None, preview_rows=20, progress_callback=None, workers=None, load=True):
         self.filepath = filepath
         self.headers = []
-        self.rows = []
+        self.table = None
+        self.preview = []
+        self.row_count = 0
+        self.row_index = None
+        self.column_aggregates = {}
         self.chunks = []
-        self.embeddings = []
-        self.load()
+        self.chunk_size = 10
+        self.chunk_tokens = None
+        self.chunk_encoding = 'json'
+        self.tail_rows = []
+        self.file_state = None
+        self.json_keys = None  # (headers, encoded JSON keys) for the 'json' chunk encoding
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.index = None
+        self.lexical = LexicalIndex()
+        self.index_kind = 'auto'
+        self.index_params = {}
+        self.preview_rows = preview_rows
+        self.progress_callback = progress_callback  # (bytes read, file size) while loading
+        self.workers = workers or os.cpu_count() or 1  # parser processes for large files
+        self.restored = False  # True when restored from a session snapshot instead of parsed
+        if stream is None:
+            stream = os.path.getsize(filepath) > self.STREAM_THRESHOLD_BYTES
+        self.stream = stream
+        if load:
+            self.load()
     
+    def use_parallel(self):
+        return self.workers > 1 and os.path.getsize(self.filepath) >= self.PARALLEL_THRESHOLD_BYTES
+    
+    @metrics.timed('csv.load')
     def load(self):
-        with open(self.filepath, 'r', encoding='utf-8') as f:
+        if self.stream:
+            self.load_streaming()
+            return
+        
+        if self.use_parallel():
+            self.headers, parts, size = load_parallel(
+                self.filepath, self.workers, progress_callback=self.progress_callback
+            )
+            tables = [table for table, _, _ in parts]
+            self.table = ColumnTable.concat(tables) if tables else ColumnTable.from_rows(self.headers, [])
+        else:
+            size = self.load_table()
+        self.row_count = len(self.table)
+        self.file_state = self.read_file_state(size)
+        self.preview = list(self.table.iter_rows(stop=self.preview_rows))
+    
+    def load_table(self):
+        """Single-process parse into the column table; returns the bytes read"""
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as f:
+            size = os.fstat(f.fileno()).st_size
             reader = csv.reader(f)
             self.headers = next(reader)
-            self.rows = list(reader)
+            rows = []
+            for batch in self.read_batches(reader, f, size):
+                rows.extend(batch)
+            self.table = ColumnTable.from_rows(self.headers, rows)
+        return size
     
-    def create_chunks(self, chunk_size=10):
-        """Create text chunks from CSV rows for embedding"""
-        self.chunks = []
+    def load_streaming(self):
+        """Single pass over the file keeping only preview rows and per-column aggregates"""
+        self.table = None
+        self.preview = []
+        self.row_count = 0
+        self.row_index = None
+        
+        if self.use_parallel():
+            self.headers, parts, size = load_parallel(
+                self.filepath, self.workers, stream=True, preview_rows=self.preview_rows,
+                progress_callback=self.progress_callback
+            )
+            self.column_aggregates = {header: RunningStats() for header in self.headers}
+            for aggregates, count, preview in parts:
+                self.preview.extend(preview[:self.preview_rows - len(self.preview)])
+                self.row_count += count
+                for header, aggregate in zip(self.headers, aggregates):
+                    self.column_aggregates[header].merge(aggregate)
+            self.file_state = self.read_file_state(size)
+            return
+        
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as f:
+            size = os.fstat(f.fileno()).st_size
+            reader = csv.reader(f)
+            self.headers = next(reader)
+            self.column_aggregates = {header: RunningStats() for header in self.headers}
+            for batch in self.read_batches(reader, f, size):
+                self.add_streamed_rows(batch)
+        
+        self.file_state = self.read_file_state(size)
+    
+    def read_batches(self, reader, f, size, batch_size=65536):
+        """Yield lists of parsed rows, reporting bytes read to progress_callback"""
+        while True:
+            batch = list(itertools.islice(reader, batch_size))
+            if not batch:
+                return
+            yield batch
+            if self.progress_callback:
+                self.progress_callback(f.buffer.tell(), size)
+    
+    def add_streamed_rows(self, rows):
+        aggregates = [self.column_aggregates[header] for header in self.headers]
+        for row in rows:
+            if self.row_count < self.preview_rows:
+                self.preview.append(row)
+            self.row_count += 1
+            for aggregate, value in zip(aggregates, row):
+                aggregate.add(value)
+    
+    def read_file_state(self, size, edge_bytes=65536):
+        """Size plus hashes of the first and last bytes parsed, used to detect appends"""
+        with open(self.filepath, 'rb') as f:
+            head = f.read(min(size, edge_bytes))
+            f.seek(max(0, size - edge_bytes))
+            tail = f.read(min(size, edge_bytes))
+        return {
+            'size': size,
+            'mtime_ns': os.stat(self.filepath).st_mtime_ns,
+            'head': hashlib.sha1(head).hexdigest(),
+            'tail': hashlib.sha1(tail).hexdigest(),
+            'complete': tail.endswith(b"\n"),
+        }
+    
+    def fingerprint(self):
+        """Identifies the file contents this parser was loaded from"""
+        state = self.file_state or {}
+        key = f"{self.filepath}|{state.get('size')}|{state.get('mtime_ns')}|{state.get('head')}|{state.get('tail')}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+    
+    def detect_change(self):
+        """'none', 'append' when rows were only added at the end, otherwise 'rewrite'"""
+        stat = os.stat(self.filepath)
+        old = self.file_state
+        if old is None:
+            return 'rewrite'
+        if stat.st_size == old['size'] and stat.st_mtime_ns == old['mtime_ns']:
+            return 'none'
+        if stat.st_size <= old['size'] or not old['complete']:
+            return 'rewrite'
+        
+        current = self.read_file_state(old['size'])
+        if current['head'] == old['head'] and current['tail'] == old['tail']:
+            return 'append'
+        return 'rewrite'
+    
+    def snapshot(self):
+        """(meta, arrays) holding the parsed rows, chunks and indexes, for Snapshot.write_snapshot"""
+        meta = {
+            'headers': self.headers, 'row_count': self.row_count, 'stream': self.stream,
+            'preview': self.preview, 'file_state': self.file_state,
+            'aggregates': {header: stats.state() for header, stats in self.column_aggregates.items()},
+            'chunk_size': self.chunk_size, 'chunk_tokens': self.chunk_tokens,
+            'chunk_encoding': self.chunk_encoding, 'tail_rows': self.tail_rows,
+        }
+        arrays = {}
+        if self.table is not None:
+            meta['table'], table_arrays = self.table.snapshot()
+            arrays.update(prefixed('table', table_arrays))
+        if self.row_index is not None:
+            meta['row_index'], row_index_arrays = self.row_index.snapshot()
+            arrays.update(prefixed('row_index', row_index_arrays))
+        if self.chunks:
+            put_strings(arrays, 'chunks', self.chunks)
+            meta['lexical'], lexical_arrays = self.lexical.snapshot()
+            arrays.update(prefixed('lexical', lexical_arrays))
+        if len(self.embeddings):
+            arrays['embeddings'] = self.embeddings
+            meta['index'], index_arrays = self.index.snapshot()
+            if self.index.kind != 'exact':
+                # The exact index scans the embeddings themselves, which are stored once above
+                arrays.update(prefixed('index', index_arrays))
+        return meta, arrays
+    
+    @classmethod
+    def from_snapshot(cls, filepath, meta, arrays, chunks=True, embeddings=True, workers=None):
+        """Parser restored from snapshot() without reading the file
+        
+        chunks=False drops the chunks and everything built from them, e.g. when the
+        chunk settings changed; embeddings=False keeps chunks but not their vectors.
+        """
+        data = cls(filepath, stream=meta['stream'], workers=workers, load=False)
+        data.restored = True
+        data.headers = meta['headers']
+        data.row_count = meta['row_count']
+        data.preview = meta['preview']
+        data.file_state = meta['file_state']
+        data.column_aggregates = {
+            header: RunningStats.from_state(state) for header, state in meta['aggregates'].items()
+        }
+        if 'table' in meta:
+            data.table = ColumnTable.from_snapshot(meta['table'], unprefixed('table', arrays))
+        if 'row_index' in meta:
+            data.row_index = RowIndex.from_snapshot(filepath, meta['row_index'], unprefixed('row_index', arrays))
+        if not chunks or 'lexical' not in meta:
+            return data
+        
+        data.chunk_size, data.chunk_tokens = meta['chunk_size'], meta['chunk_tokens']
+        data.chunk_encoding, data.tail_rows = meta['chunk_encoding'], meta['tail_rows']
+        data.chunks = get_strings(arrays, 'chunks')
+        data.lexical = LexicalIndex.from_snapshot(meta['lexical'], unprefixed('lexical', arrays))
+        if embeddings and 'index' in meta:
+            data.embeddings = arrays['embeddings']
+            index_arrays = unprefixed('index', arrays)
+            if meta['index']['kind'] == 'exact':
+                index_arrays = {'vectors': data.embeddings}
+            data.index = index_from_snapshot(meta['index'], index_arrays)
+        return data
+    
+    def iter_rows(self):
+        """Yield data rows without materializing the file when streaming"""
+        if not self.stream:
+            yield from self.table.iter_rows()
+            return
         
-        # Create metadata chunk
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+    
+    def meta_chunk(self):
         meta_chunk = f"CSV Metadata:\nColumns: {', '.join(self.headers)}\n"
-        meta_chunk += f"Total rows: {len(self.rows)}\n"
+        meta_chunk += f"Total rows: {self.row_count}\n"
         meta_chunk += f"Numeric columns: {', '.join(self.get_numeric_columns())}\n"
-        self.chunks.append(meta_chunk)
+        return meta_chunk
+    
+    def iter_chunks(self, chunk_size=10, chunk_tokens=None, encoding='json'):
+        """Yield text chunks in one pass over the rows
+        
+        Row chunks hold chunk_size rows, or with chunk_tokens as many rows as fit in
+        that many estimated tokens (chunk_size, if given, still caps the rows).
+        encoding is one of CHUNK_ENCODINGS.
+        """
+        if encoding not in self.CHUNK_ENCODINGS:
+            raise ValueError(f"Unknown chunk encoding {encoding!r}; expected one of {', '.join(self.CHUNK_ENCODINGS)}")
+        if not chunk_size and not chunk_tokens:
+            chunk_size = 10
+        yield self.meta_chunk()
+        
+        self.chunk_size = chunk_size
+        self.chunk_tokens = chunk_tokens
+        self.chunk_encoding = encoding
+        yield from self.iter_row_chunks(self.iter_rows(), 0)
+    
+    def iter_row_chunks(self, rows, start):
+        """Row chunks starting at row index start; remembers the trailing chunk that can still grow"""
+        self.tail_rows = []
+        budget = self.chunk_budget()
+        chunk_rows = []
+        chars = 0
+        for row in rows:
+            cost = self.row_chars(row) if budget is not None else 0
+            if chunk_rows and (len(chunk_rows) == self.chunk_size or (budget is not None and chars + cost > budget)):
+                yield self.format_chunk(start, chunk_rows)
+                start += len(chunk_rows)
+                chunk_rows = []
+                chars = 0
+            chunk_rows.append(row)
+            chars += cost
+        if chunk_rows:
+            # A chunk under its token budget may take appended rows, so it is always the tail
+            if budget is not None or len(chunk_rows) < self.chunk_size:
+                self.tail_rows = chunk_rows
+            yield self.format_chunk(start, chunk_rows)
+    
+    def chunk_budget(self):
+        """Characters available for row values in one chunk, or None for fixed-size chunks"""
+        if not self.chunk_tokens:
+            return None
+        overhead = 24  # "Rows a to b:" label
+        if self.chunk_encoding != 'json':
+            overhead += sum(len(h) + 2 for h in self.headers)  # header line or column labels
+        return max(1, self.chunk_tokens * self.CHARS_PER_TOKEN - overhead)
+    
+    def row_chars(self, row):
+        """Approximate characters a row adds to a chunk in the current encoding"""
+        chars = sum(map(len, row))
+        if self.chunk_encoding == 'json':
+            return chars + sum(len(h) + 6 for h in self.headers) + 2  # quoted keys, quoted values, braces
+        if self.chunk_encoding == 'columns':
+            return chars + 3 * len(row)  # " | " between values
+        return chars + len(row)  # delimiters and newline
+    
+    def estimate_chunk_count(self):
+        """Expected number of chunks (metadata included) for progress reporting"""
+        if not self.row_count:
+            return 1
+        rows_per_chunk = self.chunk_size or self.row_count
+        budget = self.chunk_budget()
+        if budget is not None and self.preview:
+            row_chars = sum(self.row_chars(row) for row in self.preview) / len(self.preview)
+            rows_per_chunk = min(rows_per_chunk, max(1, int(budget // max(1, row_chars))))
+        return 2 + (self.row_count - 1) // rows_per_chunk
+    
+    def format_chunk(self, start, chunk_rows):
+        """Rows in the chunk encoding, built with one join instead of repeated concatenation
+        
+        'json' repeats every column name on every row; 'csv' and 'tsv' state the
+        header once, and 'columns' lists each column's values on one line.
+        """
+        lines = [f"Rows {start+1} to {start+len(chunk_rows)}:"]
         
-        # Create row chunks
-        for i in range(0, len(self.rows), chunk_size):
-            chunk_rows = self.rows[i:i+chunk_size]
-            chunk_text = f"Rows {i+1} to {i+len(chunk_rows)}:\n"
-            
+        if self.chunk_encoding in ('csv', 'tsv'):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, delimiter=',' if self.chunk_encoding == 'csv' else '\t', lineterminator='\n')
+            writer.writerow(self.headers)
+            writer.writerows(chunk_rows)
+            lines.append(buffer.getvalue()[:-1])
+        elif self.chunk_encoding == 'columns':
+            for i, header in enumerate(self.headers):
+                lines.append(f"{header}: " + " | ".join(row[i] if i < len(row) else '' for row in chunk_rows))
+        elif len(set(self.headers)) == len(self.headers):
+            # Encode header keys once; per row only the values need escaping
+            # Keyed on the headers, which change when a rewritten file is reloaded
+            if self.json_keys is None or self.json_keys[0] != self.headers:
+                self.json_keys = (list(self.headers), [encode_basestring_ascii(h) + ": " for h in self.headers])
+            keys = self.json_keys[1]
+            for row in chunk_rows:
+                lines.append("{" + ", ".join(
+                    key + encode_basestring_ascii(value) for key, value in zip(keys, row)
+                ) + "}")
+        else:
             for row in chunk_rows:
-                row_dict = dict(zip(self.headers, row))
-                chunk_text += json.dumps(row_dict) + "\n"
-            
-            self.chunks.append(chunk_text)
+                lines.append(json.dumps(dict(zip(self.headers, row))))
         
+        lines.append("")
+        return "\n".join(lines)
+    
+    @metrics.timed('csv.chunk')
+    def create_chunks(self, chunk_size=10, chunk_tokens=None, encoding='json'):
+        """Create text chunks from CSV rows for embedding"""
+        self.chunks = list(self.iter_chunks(chunk_size, chunk_tokens, encoding))
+        metrics.count('chunks.created', len(self.chunks))
+        self.lexical = LexicalIndex()
+        self.lexical.add(self.chunks)
         return len(self.chunks)
     
-    def generate_embeddings(self, model='nomic-embed-text'):
-        """Generate embeddings for all chunks"""
-        import ollama
+    def generate_embeddings(self, model='nomic-embed-text', batch_size=32, workers=4,
+                            retries=3, backoff=0.5, progress_callback=None, store=None):
+        """Generate embeddings for all chunks using batched, concurrent requests"""
+        results = self.embed_texts(self.chunks, model, batch_size, workers, retries, backoff,
+                                   progress_callback, store)
+        self.set_embeddings(results)
+        return len(self.embeddings)
+    
+    @metrics.timed('embed')
+    def embed_texts(self, texts, model='nomic-embed-text', batch_size=32, workers=4,
+                    retries=3, backoff=0.5, progress_callback=None, store=None):
+        """Embed texts in concurrent batches; None marks texts that failed after all retries"""
+        # Reuse cached embeddings and only request the texts not seen before
+        results = store.get_many(texts) if store is not None else [None] * len(texts)
+        pending = [i for i, embedding in enumerate(results) if embedding is None]
+        metrics.count('embed.cache_hits', len(texts) - len(pending))
+        batches = [
+            (pending[start:start+batch_size], [texts[i] for i in pending[start:start+batch_size]])
+            for start in range(0, len(pending), batch_size)
+        ]
+        done = len(texts) - len(pending)
+        if progress_callback and done:
+            progress_callback(done, len(texts))
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {
+                executor.submit(self.embed_batch, model, batch, retries, backoff): indices
+                for indices, batch in batches
+            }
+            for future in as_completed(futures):
+                indices = futures[future]
+                try:
+                    for i, embedding in zip(indices, future.result()):
+                        results[i] = embedding
+                except Exception as e:
+                    print(f"Error generating embeddings for chunks {indices[0]}-{indices[-1]}: {e}")
+                done += len(indices)
+                if progress_callback:
+                    progress_callback(done, len(texts))
+        
+        if store is not None:
+            fresh = [i for i in pending if results[i] is not None]
+            store.put_many([texts[i] for i in fresh], [results[i] for i in fresh])
+            store.save()
+            # Cache hits from a store that was discarded for a dimension change are embedded again
+            stale = self.stale_vectors(dict(enumerate(results)), store)
+            if stale:
+                redone = self.embed_texts([texts[i] for i in stale], model, batch_size, workers, retries, backoff,
+                                          store=store)
+                for i, embedding in zip(stale, redone):
+                    results[i] = embedding
+        
+        return results
+    
+    @staticmethod
+    def stale_vectors(results, store):
+        """Keys of results whose dimension differs from the store's current one"""
+        if store.dim is None:
+            return []
+        return [i for i, vector in results.items() if vector is not None and len(vector) != store.dim]
+    
+    @metrics.timed('csv.refresh')
+    def refresh(self, model='nomic-embed-text', store=None, **embed_options):
+        """Re-index after the file changed, embedding only chunks that are new or changed
+        
+        Appended rows are parsed from the previous end offset and only the chunks
+        from the last partial one onwards are rebuilt; any other change re-chunks the
+        file but reuses embeddings of chunks whose content hash is unchanged.
+        Returns the number of chunks that were rebuilt.
+        """
+        change = self.detect_change()
+        if change == 'none':
+            return 0
+        if change == 'rewrite' or not len(self.embeddings):
+            return self.reindex(model, store, **embed_options)
         
-        self.embeddings = []
+        first_row = self.row_count - len(self.tail_rows)
+        first_chunk = len(self.chunks) - (1 if self.tail_rows else 0)
+        new_rows = self.read_appended_rows()
         
-        for i, chunk in enumerate(self.chunks):
+        chunks = list(self.iter_row_chunks(itertools.chain(self.tail_rows, new_rows), first_row))
+        self.chunks[first_chunk:] = chunks
+        self.chunks[0] = self.meta_chunk()
+        
+        positions = [0] + list(range(first_chunk, len(self.chunks)))
+        self.lexical.update(positions, [self.chunks[i] for i in positions])
+        vectors = self.embed_texts([self.chunks[i] for i in positions], model, store=store, **embed_options)
+        self.update_embeddings(positions, vectors)
+        return len(positions)
+    
+    @metrics.timed('csv.read_appended')
+    def read_appended_rows(self):
+        """Parse only the bytes added since the last load and fold them into the data"""
+        with open(self.filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(self.file_state['size'])
+            appended = f.read(size - self.file_state['size'])
+        rows = list(csv.reader(io.StringIO(appended.decode('utf-8'), newline='')))
+        
+        if self.stream:
+            self.add_streamed_rows(rows)
+            if self.row_index is not None:
+                self.row_index.extend()
+        else:
+            self.table.append_rows(rows)
+            self.row_count = len(self.table)
+            if len(self.preview) < self.preview_rows:
+                self.preview = list(self.table.iter_rows(stop=self.preview_rows))
+        self.file_state = self.read_file_state(size)
+        return rows
+    
+    @metrics.timed('csv.reindex')
+    def reindex(self, model='nomic-embed-text', store=None, **embed_options):
+        """Reload and re-chunk, reusing embeddings of chunks whose content is unchanged"""
+        previous = {}
+        if len(self.embeddings):
+            for chunk, vector in zip(self.chunks, self.embeddings):
+                previous[hashlib.sha1(chunk.encode('utf-8')).hexdigest()] = vector
+        
+        self.load()
+        self.create_chunks(self.chunk_size, self.chunk_tokens, self.chunk_encoding)
+        results = [previous.get(hashlib.sha1(chunk.encode('utf-8')).hexdigest()) for chunk in self.chunks]
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        embedded = self.embed_texts([self.chunks[i] for i in missing], model, store=store, **embed_options)
+        for i, vector in zip(missing, embedded):
+            results[i] = vector
+        self.set_embeddings(results)
+        return len(missing)
+    
+    @metrics.timed('index')
+    def index_pipelined(self, model='nomic-embed-text', chunk_size=10, batch_size=32, workers=4,
+                        retries=3, backoff=0.5, queue_size=8, progress_callback=None, store=None,
+                        chunk_tokens=None, encoding='json', checkpoint=None):
+        """Chunk, embed and store in overlapping stages connected by bounded queues
+        
+        A producer thread builds chunks and serves cache hits, worker threads embed
+        batches, and the calling thread stores vectors as they arrive.
+        checkpoint() is called before each batch request; it may block, or raise to
+        stop the run, in which case vectors embedded so far are kept in the store
+        and the exception is re-raised once the pipeline has drained.
+        """
+        workers = max(1, workers)
+        self.chunks = []
+        batches = queue.Queue(maxsize=queue_size)
+        finished = queue.Queue(maxsize=queue_size)
+        self.chunk_size, self.chunk_tokens, self.chunk_encoding = chunk_size, chunk_tokens, encoding
+        expected = self.estimate_chunk_count()
+        
+        self.lexical = LexicalIndex()
+        stopped = []
+        
+        def submit(indices):
+            texts = [self.chunks[i] for i in indices]
+            self.lexical.add(texts, indices)
+            cached = store.get_many(texts) if store is not None else [None] * len(texts)
+            hits = [(i, vector) for i, vector in zip(indices, cached) if vector is not None]
+            metrics.count('embed.cache_hits', len(hits))
+            if hits:
+                finished.put((False, [i for i, _ in hits], [vector for _, vector in hits]))
+            misses = [i for i, vector in zip(indices, cached) if vector is None]
+            if misses:
+                batches.put(misses)
+        
+        def produce():
             try:
-                response = ollama.embeddings(
-                    model=model,
-                    prompt=chunk
-                )
-                self.embeddings.append(response['embedding'])
+                batch = []
+                for chunk in self.iter_chunks(chunk_size, chunk_tokens, encoding):
+                    if stopped:
+                        break
+                    self.chunks.append(chunk)
+                    batch.append(len(self.chunks) - 1)
+                    if len(batch) == batch_size:
+                        submit(batch)
+                        batch = []
+                if batch:
+                    submit(batch)
             except Exception as e:
-                print(f"Error generating embedding for chunk {i}: {e}")
-                self.embeddings.append([0] * 768)  # Fallback empty embedding
+                print(f"Error creating chunks: {e}")
+            finally:
+                for _ in range(workers):
+                    batches.put(None)
+        
+        def work():
+            while True:
+                indices = batches.get()
+                if indices is None:
+                    finished.put(None)
+                    return
+                if checkpoint is not None and not stopped:
+                    try:
+                        checkpoint()
+                    except BaseException as e:
+                        stopped.append(e)
+                if stopped:
+                    finished.put((True, indices, None))
+                    continue
+                try:
+                    vectors = self.embed_batch(model, [self.chunks[i] for i in indices], retries, backoff)
+                except Exception as e:
+                    print(f"Error generating embeddings for chunks {indices[0]}-{indices[-1]}: {e}")
+                    vectors = None
+                finished.put((True, indices, vectors))
+        
+        threads = [threading.Thread(target=produce, daemon=True)]
+        threads += [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
         
+        results = {}
+        done = 0
+        remaining = workers
+        try:
+            while remaining:
+                item = finished.get()
+                if item is None:
+                    remaining -= 1
+                    continue
+                fresh, indices, vectors = item
+                if vectors is not None:
+                    results.update(zip(indices, vectors))
+                    if fresh and store is not None:
+                        store.put_many([self.chunks[i] for i in indices], vectors)
+                done += len(indices)
+                if progress_callback:
+                    progress_callback(done, max(expected, len(self.chunks)))
+        except BaseException as e:
+            # Stop the producer and workers, and drain so none stays blocked on a full queue
+            stopped.append(e)
+            while remaining:
+                remaining -= finished.get() is None
+            raise
+        
+        if store is not None:
+            store.save()
+        if stopped:
+            raise stopped[0]
+        
+        stale = self.stale_vectors(results, store) if store is not None else []
+        if stale:
+            vectors = self.embed_texts([self.chunks[i] for i in stale], model, batch_size, workers, retries, backoff,
+                                       store=store)
+            results.update(zip(stale, vectors))
+        
+        self.set_embeddings([results.get(i) for i in range(len(self.chunks))])
         return len(self.embeddings)
     
-    def find_relevant_chunks(self, query, model='nomic-embed-text', top_k=3):
-        """Find most relevant chunks for a query"""
-        import ollama
+    @metrics.timed('embed.batch')
+    def embed_batch(self, model, batch, retries=3, backoff=0.5):
+        """Embed a list of texts in one request; the shared client retries with exponential backoff"""
+        metrics.count('embed.chunks', len(batch))
+        response = OllamaClient.shared().embed(model, batch, retries=retries, backoff=backoff)
+        return response['embeddings']
+    
+    def set_embeddings(self, results):
+        """Store per-chunk vectors as one normalized matrix and rebuild the index"""
+        # Fallback empty embeddings for batches that failed after all retries
+        dim = next((len(e) for e in results if e is not None), 768)
+        matrix = np.zeros((len(results), dim), dtype=np.float32)
+        for i, embedding in enumerate(results):
+            if embedding is not None:
+                matrix[i] = embedding
+        self.embeddings = self.normalize(matrix)
+        self.build_index()
+    
+    @metrics.timed('embed.load_cached')
+    def load_cached_embeddings(self, store):
+        """Fill embeddings from the cache; returns True only if every chunk was cached"""
+        cached = store.get_many(self.chunks)
+        if not cached or any(embedding is None for embedding in cached):
+            return False
+        self.embeddings = self.normalize(np.asarray(cached, dtype=np.float32))
+        self.build_index()
+        return True
+    
+    def update_embeddings(self, positions, vectors):
+        """Replace or append chunk vectors and update the index in place"""
+        dim = self.embeddings.shape[1]
+        matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+        for i, vector in enumerate(vectors):
+            if vector is not None:
+                matrix[i] = vector
+        matrix = self.normalize(matrix)
+        
+        positions = np.asarray(positions)
+        existing = positions < len(self.embeddings)
+        embeddings = np.empty((len(self.embeddings) + int((~existing).sum()), dim), dtype=np.float32)
+        embeddings[:len(self.embeddings)] = self.embeddings
+        embeddings[positions] = matrix
+        self.embeddings = embeddings
         
-        if not self.embeddings:
+        if self.index.kind == 'exact':
+            self.index.build(self.embeddings)
+        else:
+            self.index.update(positions[existing], matrix[existing])
+            self.index.add(matrix[~existing])
+    
+    @metrics.timed('index.build')
+    def build_index(self, kind=None, **params):
+        """Build the retrieval index over the current embeddings"""
+        kind = kind or self.index_kind
+        params = params or self.index_params
+        self.index = create_index(kind, len(self.embeddings), **params).build(self.embeddings)
+        return self.index
+    
+    @metrics.timed('retrieve')
+    def find_relevant_chunks(self, query, model='nomic-embed-text', top_k=3, hybrid=True, query_cache=None):
+        """Find most relevant chunks for a query, fusing BM25 and vector rankings
+
+        query_cache (a ResponseCache) lets repeated queries skip embedding the query.
+        """
+        use_lexical = hybrid and len(self.lexical) > 0
+        if use_lexical:
+            # Selective identifiers (IDs, SKUs) are answered without embedding the query
+            with metrics.span('retrieve.exact'):
+                exact = self.lexical.exact_matches(query, max_docs=top_k)
+            if exact:
+                metrics.count('retrieve.exact_hits')
+                return [self.chunks[i] for i in exact]
+        
+        if len(self.embeddings) == 0:
+            if use_lexical:
+                return [self.chunks[i] for i in self.lexical.search(query, top_k)[0]]
             return []
         
         # Generate query embedding
+        query_embedding = query_cache.get_query_embedding(model, query) if query_cache is not None else None
         try:
-            query_response = ollama.embeddings(
-                model=model,
-                prompt=query
-            )
-            query_embedding = query_response['embedding']
+            if query_embedding is None:
+                with metrics.span('retrieve.embed_query'):
+                    query_response = OllamaClient.shared().embeddings(
+                        model=model,
+                        prompt=query
+                    )
+                query_embedding = query_response['embedding']
+                if query_cache is not None:
+                    query_cache.put_query_embedding(model, query, query_embedding)
+            else:
+                metrics.count('retrieve.query_cache_hits')
         except Exception as e:
             print(f"Error generating query embedding: {e}")
+            if use_lexical:
+                return [self.chunks[i] for i in self.lexical.search(query, top_k)[0]]
             return self.chunks[:top_k]  # Fallback to first chunks
         
-        # Calculate cosine similarity
-        similarities = []
-        for i, chunk_embedding in enumerate(self.embeddings):
-            similarity = self.cosine_similarity(query_embedding, chunk_embedding)
-            similarities.append((i, similarity))
+        # Cosine similarity against the pre-normalized vectors in the index
+        query_vec = self.normalize(np.asarray(query_embedding, dtype=np.float32))
+        candidates = top_k * 4 if use_lexical else top_k
+        with metrics.span('retrieve.vector'):
+            ids, _ = self.index.search(query_vec, candidates)
+        ids = ids.tolist()
         
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        if use_lexical:
+            with metrics.span('retrieve.bm25'):
+                lexical_ids, _ = self.lexical.search(query, candidates)
+            ids = reciprocal_rank_fusion([ids, lexical_ids.tolist()])
         
         # Return top K chunks
-        relevant_chunks = [self.chunks[i] for i, _ in similarities[:top_k]]
-        return relevant_chunks
+        return [self.chunks[i] for i in ids[:top_k]]
+    
+    normalize = staticmethod(normalize)
+    top_k_indices = staticmethod(top_k_indices)
     
     @staticmethod
     def cosine_similarity(vec1, vec2):
@@ -106,17 +734,38 @@ class CSVParser:
     
     def get_column(self, col_name):
         """Get all values from a column"""
+        if not self.stream:
+            column = self.table.column(col_name)
+            return column.strings() if column is not None else []
+        
         try:
             idx = self.headers.index(col_name)
-            return [row[idx] for row in self.rows if idx < len(row)]
+            # Short rows yield '' so values stay aligned with row numbers (and the planner's masks)
+            return [row[idx] if idx < len(row) else '' for row in self.iter_rows()]
         except ValueError:
             return []
     
+    def get_array(self, col_name):
+        """Typed NumPy array for a column: numbers for numeric columns, strings otherwise"""
+        if not self.stream:
+            column = self.table.column(col_name)
+            if column is None:
+                return None
+            return column.values if column.is_numeric else column.categories[column.values]
+        
+        values = self.get_column(col_name)
+        if col_name in self.get_numeric_columns():
+            return np.array([float(v) if self.is_numeric(v) else np.nan for v in values])
+        return np.array(values, dtype=object)
+    
     def get_numeric_columns(self):
         """Identify numeric columns"""
+        if not self.stream:
+            return self.table.numeric_columns()
+        
         numeric_cols = []
         for i, header in enumerate(self.headers):
-            sample = [row[i] for row in self.rows[:10] if i < len(row) and row[i]]
+            sample = [row[i] for row in self.preview[:10] if i < len(row) and row[i]]
             if sample and all(self.is_numeric(val) for val in sample):
                 numeric_cols.append(header)
         return numeric_cols
@@ -129,34 +778,108 @@ class CSVParser:
         except (ValueError, TypeError):
             return False
     
+    @metrics.timed('csv.stats')
     def get_stats(self, col_name):
         """Get statistics for a numeric column"""
-        values = [float(v) for v in self.get_column(col_name) if self.is_numeric(v)]
-        if not values:
-            return None
+        if self.stream:
+            aggregate = self.column_aggregates.get(col_name)
+            return aggregate.to_dict() if aggregate else None
         
-        return {
-            'count': len(values),
-            'mean': mean(values),
-            'median': median(values),
-            'min': min(values),
-            'max': max(values),
-            'std': stdev(values) if len(values) > 1 else 0
-        }
+        return self.table.stats(col_name)
     
-    def to_dict(self):
+    def to_dict(self, limit=None):
         """Convert to dictionary format"""
-        return [dict(zip(self.headers, row)) for row in self.rows]
+        return [dict(zip(self.headers, row)) for row in itertools.islice(self.iter_rows(), limit)]
+    
+    @metrics.timed('csv.row_index')
+    def build_row_index(self, progress_callback=None):
+        """Index row offsets so get_rows can seek in streamed files; extends an existing index"""
+        if self.row_index is None:
+            self.row_index = RowIndex(self.filepath).build(progress_callback)
+        else:
+            self.row_index.extend(progress_callback)
+        return self.row_index
+    
+    def get_rows(self, start, count):
+        """Rows start to start+count, read from the file by offset when streaming"""
+        if not self.stream:
+            return list(self.table.iter_rows(start, start + count))
+        if start + count <= len(self.preview):
+            return self.preview[start:start + count]
+        if self.row_index is None:
+            self.build_row_index()
+        return self.row_index.read(start, count)
     
-    def get_preview(self, n=20):
-        """Get first n rows as formatted string"""
+    @staticmethod
+    def format_row(values, width=20):
+        """One display line; newlines inside quoted cells are shown as spaces"""
+        return " | ".join(f"{str(v).replace(chr(10), ' ').replace(chr(13), ' '):{width}}" for v in values)
+    
+    def get_preview(self, n=20, start=0):
+        """Get n rows from start as formatted string"""
         lines = []
-        header_line = " | ".join(f"{h:20}" for h in self.headers)
+        header_line = self.format_row(self.headers)
         lines.append(header_line)
         lines.append("-" * len(header_line))
         
-        for row in self.rows[:n]:
-            row_line = " | ".join(f"{str(v):20}" for v in row)
-            lines.append(row_line)
+        for row in self.get_rows(start, n):
+            lines.append(self.format_row(row))
         
         return "\n".join(lines)
+
+
+class RunningStats:
+    """Streaming numeric aggregates (Welford) for one column"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+    
+    def add(self, value):
+        try:
+            x = float(value)
+        except (ValueError, TypeError):
+            return
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+    
+    def merge(self, other):
+        """Fold in aggregates of another part of the column (Chan et al. parallel update)"""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+    
+    def state(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+    
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = state['count'], state['mean'], state['m2']
+        stats.min, stats.max = state['min'], state['max']
+        return stats
+    
+    def to_dict(self):
+        if not self.count:
+            return None
+        
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'median': None,  # Not available from a single streaming pass
+            'min': self.min,
+            'max': self.max,
+            'std': (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0
+        }
@@ -0,0 +1,218 @@
+from Imports import *
+from Snapshot import put_strings, get_strings
+
+class Column:
+    """One typed column: int64/float64 array for numeric data, dictionary codes for text"""
+    def __init__(self, name, kind, values, categories=None, raw=None):
+        self.name = name
+        self.kind = kind  # 'int', 'float' or 'text'
+        self.values = values
+        self.categories = categories
+        self.raw = raw  # (codes, categories) when numbers don't round-trip to their source text
+
+    @classmethod
+    def from_strings(cls, name, strings):
+        """Infer the column type once from every value and build the typed array"""
+        source = np.array(strings, dtype=object)
+        present = source != ''
+
+        if present.any():
+            try:
+                if present.all():
+                    values = source.astype(np.int64)
+                    return cls.numeric(name, 'int', values, source)
+            except (ValueError, OverflowError):
+                pass
+            try:
+                values = np.full(len(source), np.nan)
+                values[present] = source[present].astype(np.float64)
+                return cls.numeric(name, 'float', values, source)
+            except ValueError:
+                pass
+
+        categories, codes = np.unique(source, return_inverse=True)
+        return cls(name, 'text', codes.astype(np.int32), categories)
+
+    @classmethod
+    def numeric(cls, name, kind, values, source):
+        rendered = cls.render_numbers(values)
+        raw = None
+        if not np.array_equal(rendered, source):
+            categories, codes = np.unique(source, return_inverse=True)
+            raw = (codes.astype(np.int32), categories)
+        return cls(name, kind, values, raw=raw)
+
+    @staticmethod
+    def render_numbers(values):
+        rendered = values.astype(str).astype(object)
+        if values.dtype.kind == 'f':
+            # Whole numbers render without a trailing ".0", as they usually appear in CSVs
+            whole = (values == np.floor(values)) & (np.abs(values) < 2 ** 53)
+            rendered[whole] = values[whole].astype(np.int64).astype(str)
+            rendered[np.isnan(values)] = ''
+        return rendered
+
+    @property
+    def is_numeric(self):
+        return self.kind != 'text'
+
+    def __len__(self):
+        return len(self.values)
+
+    def strings(self, start=0, stop=None):
+        """Original cell text for a row range"""
+        if self.kind == 'text':
+            return self.categories[self.values[start:stop]].tolist()
+        if self.raw is not None:
+            codes, categories = self.raw
+            return categories[codes[start:stop]].tolist()
+        return self.render_numbers(self.values[start:stop]).tolist()
+
+    def dictionary(self):
+        """(codes, categories) encoding of the original cell text"""
+        if self.kind == 'text':
+            return self.values, self.categories
+        if self.raw is not None:
+            return self.raw
+        categories, codes = np.unique(self.render_numbers(self.values), return_inverse=True)
+        return codes.astype(np.int32), categories
+
+    @staticmethod
+    def merge_dictionaries(parts):
+        """Concatenate (codes, categories) parts under one sorted dictionary"""
+        categories, inverse = np.unique(np.concatenate([part[1] for part in parts]), return_inverse=True)
+        codes = []
+        offset = 0
+        for part_codes, part_categories in parts:
+            codes.append(inverse[offset:offset + len(part_categories)][part_codes])
+            offset += len(part_categories)
+        return np.concatenate(codes).astype(np.int32), categories
+
+    def concat(self, other):
+        """Column holding this column's rows followed by other's"""
+        return Column.concat_all([self, other])
+
+    @classmethod
+    def concat_all(cls, columns):
+        """Column holding the rows of each column in order, with one dictionary merge"""
+        name = columns[0].name
+        if len(columns) == 1:
+            return columns[0]
+        if all(column.kind == 'text' for column in columns):
+            values, categories = cls.merge_dictionaries([column.dictionary() for column in columns])
+            return cls(name, 'text', values, categories)
+        if all(column.is_numeric for column in columns):
+            kind = 'int' if all(column.kind == 'int' for column in columns) else 'float'
+            dtype = np.int64 if kind == 'int' else np.float64
+            values = np.concatenate([column.values.astype(dtype, copy=False) for column in columns])
+            raw = None
+            if any(column.raw is not None for column in columns):
+                raw = cls.merge_dictionaries([column.dictionary() for column in columns])
+            return cls(name, kind, values, raw=raw)
+        # Mixed types: re-infer from the original text
+        return cls.from_strings(name, [value for column in columns for value in column.strings()])
+
+    def numbers(self):
+        """Non-missing numeric values as float64"""
+        values = self.values.astype(np.float64, copy=False)
+        return values[~np.isnan(values)] if self.kind == 'float' else values
+
+
+class ColumnTable:
+    """Columnar, typed in-memory table built once at load time"""
+    def __init__(self, columns, num_rows):
+        self.columns = columns
+        self.by_name = {column.name: column for column in columns}
+        self.num_rows = num_rows
+        self.stats_cache = {}
+
+    @classmethod
+    def from_rows(cls, headers, rows):
+        columns = []
+        for i, header in enumerate(headers):
+            strings = [row[i] if i < len(row) else '' for row in rows]
+            columns.append(Column.from_strings(header, strings))
+        return cls(columns, len(rows))
+
+    @classmethod
+    def concat(cls, tables):
+        """Table holding the rows of each table in order, e.g. parts parsed in parallel"""
+        columns = [Column.concat_all(list(parts)) for parts in zip(*(table.columns for table in tables))]
+        return cls(columns, sum(len(table) for table in tables))
+
+    def __len__(self):
+        return self.num_rows
+
+    def snapshot(self):
+        """(meta, arrays) for a session snapshot; typed arrays are stored as they are in memory"""
+        meta = {'num_rows': self.num_rows, 'columns': []}
+        arrays = {}
+        for i, column in enumerate(self.columns):
+            meta['columns'].append({'name': column.name, 'kind': column.kind, 'raw': column.raw is not None})
+            arrays[f"{i}.values"] = column.values
+            if column.kind == 'text':
+                put_strings(arrays, f"{i}.categories", column.categories)
+            if column.raw is not None:
+                arrays[f"{i}.raw"] = column.raw[0]
+                put_strings(arrays, f"{i}.raw_categories", column.raw[1])
+        return meta, arrays
+
+    @classmethod
+    def from_snapshot(cls, meta, arrays):
+        """Table over the snapshot's mapped arrays; only the dictionaries are decoded"""
+        columns = []
+        for i, spec in enumerate(meta['columns']):
+            categories = raw = None
+            if spec['kind'] == 'text':
+                categories = np.array(get_strings(arrays, f"{i}.categories"), dtype=object)
+            if spec['raw']:
+                raw = (arrays[f"{i}.raw"], np.array(get_strings(arrays, f"{i}.raw_categories"), dtype=object))
+            columns.append(Column(spec['name'], spec['kind'], arrays[f"{i}.values"], categories, raw))
+        return cls(columns, meta['num_rows'])
+
+    def append_rows(self, rows):
+        """Append parsed rows, re-encoding only the new values"""
+        if not rows:
+            return
+        headers = [column.name for column in self.columns]
+        appended = ColumnTable.from_rows(headers, rows)
+        self.columns = [column.concat(new) for column, new in zip(self.columns, appended.columns)]
+        self.by_name = {column.name: column for column in self.columns}
+        self.num_rows += len(rows)
+        self.stats_cache = {}
+
+    def column(self, name):
+        return self.by_name.get(name)
+
+    def numeric_columns(self):
+        return [column.name for column in self.columns if column.is_numeric]
+
+    def iter_rows(self, start=0, stop=None, block_size=4096):
+        """Yield rows as lists of strings, rendering one block of each column at a time"""
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        for block_start in range(start, stop, block_size):
+            block_stop = min(block_start + block_size, stop)
+            block = [column.strings(block_start, block_stop) for column in self.columns]
+            for row in zip(*block):
+                yield list(row)
+
+    def stats(self, name):
+        """Vectorized statistics for a numeric column, cached per column"""
+        if name in self.stats_cache:
+            return self.stats_cache[name]
+
+        column = self.column(name)
+        stats = None
+        if column is not None and column.is_numeric:
+            values = column.numbers()
+            if len(values):
+                stats = {
+                    'count': int(len(values)),
+                    'mean': float(values.mean()),
+                    'median': float(np.median(values)),
+                    'min': float(values.min()),
+                    'max': float(values.max()),
+                    'std': float(values.std(ddof=1)) if len(values) > 1 else 0
+                }
+        self.stats_cache[name] = stats
+        return stats
@@ -0,0 +1,104 @@
+from Imports import *
+
+class ConversationContext:
+    """Token-budgeted chat context: dataset preamble, deduplicated chunks, compacted history"""
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, max_tokens=4096, response_tokens=512, chunk_tokens=1536, recent_turns=4):
+        self.max_tokens = max_tokens
+        self.response_tokens = response_tokens
+        self.chunk_tokens = chunk_tokens
+        self.recent_turns = recent_turns
+        self.preamble = ""
+        self.chunks = {}  # chunk hash -> text, oldest first
+        self.history = []  # (question, answer) pairs kept verbatim
+        self.compacted = []  # condensed lines for older turns
+
+    @classmethod
+    def estimate_tokens(cls, text):
+        return len(text) // cls.CHARS_PER_TOKEN + 1
+
+    @classmethod
+    def truncate(cls, text, tokens):
+        limit = tokens * cls.CHARS_PER_TOKEN
+        return text if len(text) <= limit else text[:limit] + "..."
+
+    def set_dataset(self, preamble):
+        """Set the static dataset description; resets chunks sent for the previous dataset"""
+        self.preamble = preamble
+        self.chunks = {}
+
+    def clear(self):
+        self.chunks = {}
+        self.history = []
+        self.compacted = []
+
+    def add_chunks(self, chunks):
+        """Add retrieved chunks once each, evicting the oldest past the chunk budget"""
+        new_chunks = 0
+        for chunk in chunks:
+            key = hashlib.sha1(chunk.encode('utf-8')).hexdigest()
+            if key in self.chunks:
+                # Move re-retrieved chunks to the end so they are evicted last
+                self.chunks[key] = self.chunks.pop(key)
+                continue
+            self.chunks[key] = chunk
+            new_chunks += 1
+
+        while len(self.chunks) > 1 and sum(self.estimate_tokens(c) for c in self.chunks.values()) > self.chunk_tokens:
+            del self.chunks[next(iter(self.chunks))]
+        return new_chunks
+
+    def add_turn(self, question, answer):
+        """Record the plain question (not the expanded prompt) and its answer"""
+        self.history.append((question, answer))
+        while len(self.history) > self.recent_turns:
+            self.compact_oldest()
+
+    def compact_oldest(self):
+        question, answer = self.history.pop(0)
+        self.compacted.append(f"Q: {self.truncate(question, 40)} A: {self.truncate(answer, 60)}")
+
+    def system_message(self, budget):
+        parts = [self.truncate(self.preamble, budget // 2)]
+        if self.chunks:
+            parts.append("Relevant Data:\n" + "\n\n".join(self.chunks.values()))
+        if self.compacted:
+            parts.append("Earlier conversation (condensed):\n" + "\n".join(self.compacted))
+        return "\n\n".join(parts)
+
+    def build_messages(self, question, chunks=(), context_info=""):
+        """Messages for one turn, trimmed to fit max_tokens minus the response reserve"""
+        self.add_chunks(chunks)
+        budget = self.max_tokens - self.response_tokens
+        question_text = f"{question}\n\nAnswer based on the data provided. {context_info}".strip()
+
+        while True:
+            system = self.system_message(budget)
+            turns = []
+            for past_question, past_answer in self.history:
+                turns.append({'role': 'user', 'content': past_question})
+                turns.append({'role': 'assistant', 'content': past_answer})
+            used = sum(self.estimate_tokens(m['content']) for m in turns)
+            used += self.estimate_tokens(system) + self.estimate_tokens(question_text)
+            if used <= budget:
+                break
+
+            # Shed load oldest-first: verbatim turns, then condensed turns, then chunks
+            if self.history:
+                self.compact_oldest()
+            elif len(self.compacted) > 1:
+                self.compacted.pop(0)
+            elif len(self.chunks) > 1:
+                del self.chunks[next(iter(self.chunks))]
+            else:
+                break
+
+        return (
+            [{'role': 'system', 'content': system}]
+            + turns
+            + [{'role': 'user', 'content': question_text}]
+        )
+
+    def token_count(self, messages):
+        return sum(self.estimate_tokens(m['content']) for m in messages)
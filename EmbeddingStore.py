@@ -0,0 +1,146 @@
+from Imports import *
+
+class EmbeddingStore:
+    """Persistent embedding cache keyed by (model, chunk text hash)
+
+    Vectors are appended to a float32 file that is memory-mapped on load;
+    entries are evicted least-recently-used past max_entries/max_bytes.
+    """
+    def __init__(self, model, cache_dir=None, max_entries=None, max_bytes=None):
+        self.model = model
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.expanduser("~"), ".cache", "document-summarizer", "embeddings"
+        )
+        self.path = os.path.join(self.cache_dir, self.safe_name(model))
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.index_path = os.path.join(self.path, "index.json")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.dim = None
+        self.entries = {}  # hash -> [row, last_used]
+        self.vectors = None
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def safe_name(model):
+        return "".join(c if c.isalnum() or c in "-_." else "_" for c in model)
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.dim = index['dim']
+            self.entries = index['entries']
+            self.map_vectors()
+        except Exception as e:
+            print(f"Error loading embedding cache {self.path}: {e}")
+            self.dim = None
+            self.entries = {}
+            self.vectors = None
+
+    def map_vectors(self):
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if self.dim else 0
+        if rows == 0:
+            self.vectors = None
+            return
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def get_many(self, texts):
+        """Return the cached vector for each text, or None where it is missing"""
+        now = time.time()
+        results = []
+        with self.lock:
+            for text in texts:
+                entry = self.entries.get(self.key(text))
+                if entry is None or self.vectors is None or entry[0] >= len(self.vectors):
+                    results.append(None)
+                    continue
+                entry[1] = now
+                results.append(self.vectors[entry[0]])
+        return results
+
+    def put_many(self, texts, vectors):
+        """Append vectors for texts not already cached"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        now = time.time()
+        with self.lock:
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                # A cache left by another version of the model; its vectors are useless now
+                print(f"Embedding cache {self.path} has dimension {self.dim} but the model returns "
+                      f"{vectors.shape[1]}; discarding it")
+                self.discard()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+
+            os.makedirs(self.path, exist_ok=True)
+            next_row = len(self.vectors) if self.vectors is not None else 0
+            new_rows = []
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self.entries:
+                    continue
+                self.entries[key] = [next_row + len(new_rows), now]
+                new_rows.append(vector)
+
+            if new_rows:
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(np.asarray(new_rows, dtype=np.float32).tobytes())
+                self.map_vectors()
+
+    def discard(self):
+        """Drop every entry and the vector file (lock held)"""
+        self.entries = {}
+        self.vectors = None
+        self.dim = None
+        for path in (self.vectors_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save(self):
+        """Evict over-limit entries and write the index to disk"""
+        with self.lock:
+            if self.dim is None:
+                return
+            self.evict()
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model, 'dim': self.dim, 'entries': self.entries}, f)
+            os.replace(tmp_path, self.index_path)
+
+    def evict(self):
+        limit = self.max_entries
+        if self.max_bytes is not None:
+            by_size = self.max_bytes // (4 * self.dim)
+            limit = by_size if limit is None else min(limit, by_size)
+
+        dead_rows = (len(self.vectors) if self.vectors is not None else 0) - len(self.entries)
+        if (limit is None or len(self.entries) <= limit) and dead_rows <= len(self.entries):
+            return
+
+        # Keep the most recently used entries and compact the vector file
+        keep = sorted(self.entries.items(), key=lambda item: item[1][1], reverse=True)
+        if limit is not None:
+            keep = keep[:limit]
+
+        tmp_path = self.vectors_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for row, (key, entry) in enumerate(keep):
+                f.write(np.asarray(self.vectors[entry[0]], dtype=np.float32).tobytes())
+                entry[0] = row
+        self.vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self.entries = dict(keep)
+        self.map_vectors()
@@ -0,0 +1,357 @@
+from Imports import *
+from CSVParser import CSVParser
+from EmbeddingStore import EmbeddingStore
+from Profiler import Profiler, DatasetProfile
+from QueryPlanner import QueryPlanner
+from ResponseCache import ResponseCache
+from MapReduceSummarizer import MapReduceSummarizer
+from OllamaClient import OllamaClient
+from Metrics import metrics
+from Snapshot import write_snapshot, read_snapshot, snapshot_files
+
+class Engine:
+    """GUI-free core: loading, profiling, chunking, embedding and prompt building"""
+    SNAPSHOT_VERSION = 3
+    SNAPSHOT_SUFFIX = ".snapshot"
+
+    def __init__(self, model='gemma3:1b', embedding_model='nomic-embed-text', chunk_size=None,
+                 chunk_tokens=384, chunk_encoding='csv', embed_workers=4, store=None, profiler=None,
+                 response_cache=None, use_cache=True, cache_query_embeddings=True, summary_workers=2,
+                 parse_workers=None, use_snapshots=True):
+        self.model = model
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size  # max rows per chunk; None leaves it to the token budget
+        self.chunk_tokens = chunk_tokens
+        self.chunk_encoding = chunk_encoding
+        self.embed_workers = embed_workers
+        # An empty EmbeddingStore is falsy (it has __len__), so test for None explicitly
+        self.embedding_store = store if store is not None else EmbeddingStore(embedding_model)
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.use_cache = use_cache
+        self.cache_query_embeddings = cache_query_embeddings
+        self.summary_workers = summary_workers
+        self.parse_workers = parse_workers  # processes for parsing large files (default: CPU count)
+        self.use_snapshots = use_snapshots  # read and write session snapshots next to each file
+
+    def load(self, path, stream=None, progress_callback=None):
+        """Parsed file, restored from its session snapshot instead when that is up to date"""
+        if self.use_snapshots and stream is None:
+            data = self.restore_snapshot(path)
+            if data is not None:
+                return data
+        return CSVParser(path, stream=stream, progress_callback=progress_callback, workers=self.parse_workers)
+
+    def snapshot_path(self, path):
+        return path + self.SNAPSHOT_SUFFIX
+
+    @metrics.timed('snapshot.save')
+    def save_snapshot(self, data):
+        """Write the parsed table, column profile, chunks and embeddings to one file next to the data
+
+        Returns the file written, or None if snapshots are off or it could not be written.
+        """
+        if not self.use_snapshots:
+            return None
+        path = self.snapshot_path(data.filepath)
+        try:
+            meta, arrays = data.snapshot()
+            return write_snapshot(path, {
+                'version': self.SNAPSHOT_VERSION,
+                'embedding_model': self.embedding_model,
+                'profile': self.profiler.profile(data).state(),
+                'data': meta,
+            }, arrays)
+        except Exception as e:
+            print(f"Error writing snapshot {path}: {e}")
+            return None
+
+    @metrics.timed('snapshot.restore')
+    def restore_snapshot(self, path):
+        """Data restored from the snapshot next to path, or None if there is none or the file has changed
+
+        Arrays stay memory-mapped, so only text dictionaries and chunks are decoded.
+        Chunks are restored only if they were built with the current chunk settings,
+        and embeddings only if they came from the current embedding model.
+        """
+        snapshot_path = self.snapshot_path(path)
+        if not snapshot_files(snapshot_path):
+            return None
+        try:
+            snapshot, arrays = read_snapshot(snapshot_path)
+            if snapshot['version'] != self.SNAPSHOT_VERSION:
+                return None
+            meta = snapshot['data']
+            stat = os.stat(path)
+            state = meta['file_state']
+            if (stat.st_size, stat.st_mtime_ns) != (state['size'], state['mtime_ns']):
+                return None
+
+            settings = (meta['chunk_size'], meta['chunk_tokens'], meta['chunk_encoding'])
+            same_chunks = settings == (self.chunk_size, self.chunk_tokens, self.chunk_encoding)
+            data = CSVParser.from_snapshot(
+                path, meta, arrays, chunks=same_chunks,
+                embeddings=snapshot['embedding_model'] == self.embedding_model, workers=self.parse_workers
+            )
+            self.profiler.remember(data, DatasetProfile.from_state(snapshot['profile']))
+            return data
+        except Exception as e:
+            print(f"Error reading snapshot {snapshot_path}: {e}")
+            return None
+
+    @metrics.timed('summary.basic')
+    def basic_summary(self, data, filename):
+        """Statistical summary text and the column profile it was built from"""
+        summary_parts = []
+        summary_parts.append(f"Dataset: {filename}")
+        summary_parts.append(f"Total Records: {data.row_count}")
+        summary_parts.append(f"Total Columns: {len(data.headers)}")
+
+        profile = self.profiler.profile(data)
+        columns = profile.to_dict()
+        numeric_cols = [h for h in data.headers if columns[h]['type'] == 'numeric']
+        text_cols = [h for h in data.headers if h not in numeric_cols]
+
+        if numeric_cols:
+            summary_parts.append(f"\nNumeric Columns ({len(numeric_cols)}): {', '.join(numeric_cols)}")
+        if text_cols:
+            summary_parts.append(f"\nText Columns ({len(text_cols)}): {', '.join(text_cols)}")
+
+        if numeric_cols:
+            summary_parts.append("\nNumeric Statistics:")
+            for col in numeric_cols:
+                stats = columns[col]
+                summary_parts.append(
+                    f"  {col}: mean={stats['mean']:.2f}, std={stats['std']:.2f}, "
+                    f"min={stats['min']:.2f}, median={stats['quantiles'][0.5]:.2f}, "
+                    f"max={stats['max']:.2f}, nulls={stats['nulls']}"
+                )
+
+        if text_cols:
+            summary_parts.append("\nText Statistics:")
+            for col in text_cols:
+                stats = columns[col]
+                summary_parts.append(
+                    f"  {col}: ~{stats['distinct']} distinct values, nulls={stats['nulls']}"
+                )
+
+        return "\n".join(summary_parts), profile
+
+    def dataset_preamble(self, data, filename, summary):
+        return (
+            f"CSV Dataset: {filename}\n"
+            f"Total Rows: {data.row_count}\n"
+            f"Columns: {', '.join(data.headers)}\n\n"
+            f"Statistics:\n{summary}"
+        )
+
+    def index(self, data, progress_callback=None, checkpoint=None):
+        """Chunk and embed the data in one pipeline, reusing cached embeddings"""
+        return data.index_pipelined(
+            self.embedding_model,
+            chunk_size=self.chunk_size,
+            chunk_tokens=self.chunk_tokens,
+            encoding=self.chunk_encoding,
+            workers=self.embed_workers,
+            progress_callback=progress_callback,
+            store=self.embedding_store,
+            checkpoint=checkpoint
+        )
+
+    def create_chunks(self, data):
+        return data.create_chunks(self.chunk_size, self.chunk_tokens, self.chunk_encoding)
+
+    def restore_index(self, data):
+        """Chunk the data and load embeddings only if every chunk is already cached"""
+        if len(data.embeddings):
+            return True  # restored with the data from its snapshot
+        if not data.chunks:
+            self.create_chunks(data)
+        return data.load_cached_embeddings(self.embedding_store)
+
+    def refresh(self, data):
+        """Bring data, and its index if one was built, up to date with the file on disk"""
+        if len(data.embeddings):
+            return data.refresh(self.embedding_model, store=self.embedding_store, workers=self.embed_workers)
+
+        change = data.detect_change()
+        if change == 'append':
+            data.read_appended_rows()
+        elif change == 'rewrite':
+            data.load()
+        if change != 'none' and data.chunks:
+            # Keep chunks and the lexical index built from them in step with the rows
+            return self.create_chunks(data)
+        return 0
+
+    def summary_prompt(self, data, filename, summary, use_embeddings, context=None):
+        # Use relevant chunks if embeddings are ready, unless the caller supplies the context
+        if context is None and use_embeddings:
+            relevant_chunks = data.find_relevant_chunks(
+                "summary statistics overview",
+                self.embedding_model,
+                top_k=5,
+                query_cache=self.query_cache()
+            )
+            context = "\n\n".join(relevant_chunks)
+        elif context is None:
+            # Fallback to sample data
+            context = json.dumps(data.to_dict(limit=10), indent=2)
+
+        return f"""Analyze this document:
+
+                            Filename: {filename}
+                            Total Rows: {data.row_count}
+                            Columns: {', '.join(data.headers)}
+
+                            {context}
+
+                            Statistics:
+                            {summary}
+
+                            Provide:
+                            1. Dataset overview
+                            2. Key patterns and insights
+                            3. Data quality observations
+
+                            Keep it concise."""
+
+    @metrics.timed('summary.map_reduce')
+    def full_summary_prompt(self, data, filename, summary, progress_callback=None, checkpoint=None):
+        """Summary prompt built from map-reduce summaries of every chunk instead of a sample"""
+        if not data.chunks:
+            self.create_chunks(data)
+        summarizer = MapReduceSummarizer(
+            self.chat,
+            self.model,
+            cache=self.partial_cache(data) if self.use_cache else None,
+            workers=self.summary_workers,
+            checkpoint=checkpoint
+        )
+        # Row chunks only: the metadata chunk changes on every append and is in the prompt anyway
+        partials = summarizer.summarize(data.chunks[1:], filename, data.headers, progress_callback)
+        context = "Summaries covering every row:\n\n" + "\n\n".join(partials)
+        return self.summary_prompt(data, filename, summary, use_embeddings=False, context=context)
+
+    def partial_cache(self, data):
+        """Map-reduce partial summaries of one file, kept apart from answers and sized to hold all of them"""
+        name = "partials-" + hashlib.sha1(os.path.abspath(data.filepath).encode('utf-8')).hexdigest()[:16]
+        # A summary tree has at most twice as many nodes as chunks; the rest is room for superseded branches
+        return ResponseCache(self.response_cache.cache_dir, max_entries=4 * len(data.chunks) + 100, name=name)
+
+    @metrics.timed('question.chunks')
+    def question_chunks(self, data, question, use_embeddings):
+        """Chunks to answer a question with, plus a note on where they came from"""
+        # Aggregate questions are computed exactly over every row instead of from samples
+        with metrics.span('question.plan'):
+            computed = QueryPlanner(data).answer(question)
+        if computed:
+            metrics.count('question.computed')
+            return [computed], "The result above was computed over the full dataset; state it as given"
+
+        # Use embeddings (or the lexical index built while chunking) for retrieval if available
+        if use_embeddings or len(data.lexical):
+            relevant_chunks = data.find_relevant_chunks(
+                question,
+                self.embedding_model,
+                top_k=3,
+                query_cache=self.query_cache()
+            )
+            return relevant_chunks, f"Retrieved {len(relevant_chunks)} relevant data chunks"
+
+        # Fallback to sample
+        return (
+            [json.dumps(data.to_dict(limit=5), indent=2)],
+            "Using sample data (generate embeddings for full access)"
+        )
+
+    def query_cache(self):
+        return self.response_cache if self.use_cache and self.cache_query_embeddings else None
+
+    def response_key(self, data, question, chunks=(), history=()):
+        """Cache key for answering question from chunks after the earlier questions in history
+
+        Returns None when caching is bypassed.
+        """
+        if not self.use_cache:
+            return None
+        return ResponseCache.key(
+            self.model,
+            data.fingerprint(),
+            " | ".join(list(history) + [question]),
+            [ResponseCache.chunk_id(chunk) for chunk in chunks]
+        )
+
+    def cached_response(self, key):
+        if not key:
+            return None
+        response = self.response_cache.get(key)
+        metrics.count('cache.response_hits' if response is not None else 'cache.response_misses')
+        return response
+
+    def store_response(self, key, response):
+        if key and response:
+            self.response_cache.put(key, response)
+            self.response_cache.save()
+
+    @metrics.timed('llm.chat')
+    def chat(self, messages, options=None):
+        response = OllamaClient.shared().chat(self.model, messages, options=options)
+        self.count_tokens(response)
+        return response['message']['content']
+
+    @staticmethod
+    def count_tokens(response):
+        """Record prompt and generated token counts reported in a final chat response"""
+        metrics.count('llm.prompt_tokens', response.get('prompt_eval_count') or 0)
+        metrics.count('llm.output_tokens', response.get('eval_count') or 0)
+
+    @metrics.profiled('file')
+    @metrics.timed('file')
+    def summarize_file(self, path, embed=True, full=False):
+        """Run load -> chunk -> embed -> summarize for one file, timing each stage
+
+        full summarizes every chunk with map-reduce instead of a retrieved sample.
+        """
+        filename = os.path.basename(path)
+        timings = {}
+        record = {'file': path}
+        start = time.perf_counter()
+        try:
+            stage = time.perf_counter()
+            data = self.load(path)
+            summary, _ = self.basic_summary(data, filename)
+            timings['load'] = time.perf_counter() - stage
+            record.update({'rows': data.row_count, 'columns': len(data.headers)})
+
+            indexed = False
+            if embed:
+                # Chunking and embedding overlap, so they are timed as one stage
+                stage = time.perf_counter()
+                indexed = not len(data.embeddings)
+                record['embeddings'] = self.index(data) if indexed else len(data.embeddings)
+                timings['index'] = time.perf_counter() - stage
+            record['snapshot'] = data.restored
+            if indexed or not data.restored:
+                stage = time.perf_counter()
+                self.save_snapshot(data)
+                timings['snapshot'] = time.perf_counter() - stage
+
+            stage = time.perf_counter()
+            if full:
+                prompt = self.full_summary_prompt(data, filename, summary)
+            else:
+                prompt = self.summary_prompt(data, filename, summary, use_embeddings=embed)
+            key = self.response_key(data, "summary", [prompt])
+            record['summary'] = self.cached_response(key)
+            record['cached'] = record['summary'] is not None
+            if not record['cached']:
+                record['summary'] = self.chat([{'role': 'user', 'content': prompt}])
+                self.store_response(key, record['summary'])
+            timings['summarize'] = time.perf_counter() - stage
+        except Exception as e:
+            record['error'] = str(e)
+
+        timings['total'] = time.perf_counter() - start
+        record['timings'] = timings
+        return record
@@ -0,0 +1,147 @@
+from Imports import *
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from LexicalIndex import tokenize
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def token_slot(token, dim):
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest[:4], 'little') % dim, 1.0 if digest[4] & 1 else -1.0
+
+
+def hashed_embedding(text, dim=256):
+    """Deterministic bag-of-words embedding that needs no model server"""
+    slots = [token_slot(token, dim) for token in tokenize(text)]
+    if not slots:
+        return np.zeros(dim, dtype=np.float32)
+    buckets, signs = zip(*slots)
+    return np.bincount(buckets, weights=signs, minlength=dim).astype(np.float32)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/':
+            self.send_json("Ollama is running")
+        elif self.path == '/api/ps':
+            self.send_json({'models': [{'name': name} for name in sorted(self.server.fake.loaded)]})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        fake = self.server.fake
+        fake.count(self.path)
+        fake.load_model(payload.get('model', ''))
+        time.sleep(fake.latency)
+
+        if self.path == '/api/embed':
+            texts = [payload['input']] if isinstance(payload['input'], str) else payload['input']
+            self.send_json({'embeddings': [fake.embedding(text) for text in texts]})
+        elif self.path == '/api/embeddings':
+            self.send_json({'embedding': fake.embedding(payload['prompt'])})
+        elif self.path == '/api/generate':
+            self.send_json({'response': fake.reply(payload.get('prompt', '')) if payload.get('prompt') else '',
+                            'done': True})
+        elif self.path == '/api/chat':
+            messages = payload.get('messages') or [{'content': ''}]
+            words = fake.reply(messages[-1]['content']).split()
+            counts = {
+                'prompt_eval_count': sum(len(m['content']) for m in messages) // 4,
+                'eval_count': len(words), 'eval_duration': int(fake.latency * 1e9) or 1,
+            }
+            if payload.get('stream', True):
+                lines = [{'message': {'content': word + ' '}, 'done': False} for word in words]
+                lines.append(dict(counts, message={'content': ''}, done=True))
+                self.send_json("\n".join(json.dumps(line) for line in lines) + "\n")
+            else:
+                self.send_json(dict(counts, message={'role': 'assistant', 'content': " ".join(words)}, done=True))
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+
+class FakeOllama:
+    """Stand-in for `ollama serve` speaking the subset of the API the app uses
+
+    Embeddings are deterministic hashed bag-of-words vectors and chat replies are
+    canned text, with optional per-request latency and first-use model load time.
+    """
+    def __init__(self, host='127.0.0.1', port=0, dim=256, latency=0.0, load_time=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.load_time = load_time
+        self.loaded = set()
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] += 1
+
+    def load_model(self, model):
+        with self.lock:
+            loading = model not in self.loaded
+            self.loaded.add(model)
+        if loading:
+            time.sleep(self.load_time)
+
+    def embedding(self, text):
+        return hashed_embedding(text, self.dim).tolist()
+
+    @staticmethod
+    def reply(prompt):
+        return f"Summary of {len(prompt)} characters of input: the data looks consistent."
+
+    def start(self):
+        """Serve from a background thread; returns self for chaining"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for tests and benchmarks")
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--load-time', type=float, default=0.0, help="seconds added to the first request per model")
+    args = parser.parse_args()
+
+    # Bind where `ollama serve` would, so OllamaServer can launch this in its place
+    host, _, port = os.environ.get('OLLAMA_HOST', '127.0.0.1:11434').rpartition(':')
+    host = host.split('://')[-1] or '127.0.0.1'
+    fake = FakeOllama(host, int(port), dim=args.dim, latency=args.latency, load_time=args.load_time)
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
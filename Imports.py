@@ -1,12 +1,57 @@
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
 import subprocess
 import time
-import requests
 import os
+import re
+import sys
+import io
+import tempfile
 import threading
+import queue
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
 import csv
 import json
-from statistics import mean, median, stdev
-import numpy as np
-import ollama
\ No newline at end of file
+from json.encoder import encode_basestring_ascii
+import itertools
+import bisect
+import heapq
+import functools
+from collections import Counter, deque
+import contextlib
+import atexit
+import hashlib
+import base64
+from urllib.parse import urlsplit
+import importlib
+import mmap
+import struct
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access
+
+    The GUI toolkit, numpy and requests make up most of the startup time; the CLI
+    never needs the toolkit and parser processes never need requests.
+    """
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        # Later lookups are found in the instance dict, at normal attribute speed
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+ctk = LazyModule('customtkinter')
+filedialog = LazyModule('tkinter.filedialog')
+messagebox = LazyModule('tkinter.messagebox')
+tkfont = LazyModule('tkinter.font')
+requests = LazyModule('requests')
+np = LazyModule('numpy')
+
+OLLAMA_ADDRESS = "http://localhost:11434"
\ No newline at end of file
@@ -0,0 +1,209 @@
+from Imports import *
+
+# Lower numbers run first
+INTERACTIVE = 0  # questions typed by the user
+SUMMARY = 1
+BACKGROUND = 2  # embedding, restoring and refreshing indexes
+
+
+class JobCancelled(BaseException):
+    """Raised inside a cancelled job at its next checkpoint
+
+    A BaseException, like asyncio.CancelledError, so `except Exception` error
+    handlers in job bodies do not swallow it.
+    """
+
+
+class Job:
+    def __init__(self, scheduler, name, fn, priority, key, on_finished=None):
+        self.scheduler = scheduler
+        self.name = name
+        self.fn = fn  # fn(job); call job.checkpoint() between steps
+        self.priority = priority
+        self.key = key
+        self.on_finished = on_finished  # on_finished(job) once the job ends, even if it never ran
+        self.status = 'queued'  # queued, running, paused, done, failed or cancelled
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+    def checkpoint(self):
+        """Stop here if cancelled; otherwise wait while higher-priority jobs are queued or running"""
+        if self.cancelled:
+            raise JobCancelled(self.name)
+        self.scheduler.wait_for_turn(self)
+        if self.cancelled:
+            raise JobCancelled(self.name)
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+class JobScheduler:
+    """Runs jobs in priority order on a few threads, with deduplication and cooperative cancellation
+
+    A running job that reaches checkpoint() while a higher-priority job is waiting
+    is paused and gives up its slot, so interactive work overtakes long background
+    runs between their requests.
+    """
+    def __init__(self, max_running=2):
+        self.max_running = max_running
+        self.condition = threading.Condition()
+        self.queue = []  # heap of (priority, sequence, job)
+        self.sequence = itertools.count()
+        self.running = set()
+        self.paused = set()
+        self.by_key = {}
+        self.listeners = []
+        self.closed = False
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, name, fn, priority=BACKGROUND, key=None, on_finished=None):
+        """Queue fn(job); if a job with the same key is queued or running, return that job instead
+
+        on_finished(job) is called on the job's thread (or the cancelling thread for a
+        job cancelled while queued) when it is done, failed or cancelled.
+        """
+        with self.condition:
+            if key is not None and key in self.by_key:
+                return self.by_key[key]
+            job = Job(self, name, fn, priority, key, on_finished)
+            if key is not None:
+                self.by_key[key] = job
+            heapq.heappush(self.queue, (priority, next(self.sequence), job))
+            self.condition.notify_all()
+        self.changed()
+        return job
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self.can_start():
+                    self.condition.wait()
+                if self.closed:
+                    return
+                _, _, job = heapq.heappop(self.queue)
+                job.status = 'running'
+                self.running.add(job)
+                # Waiting lower-priority jobs re-check whether they are outranked
+                self.condition.notify_all()
+            threading.Thread(target=self.run, args=(job,), name=f"job-{job.name}", daemon=True).start()
+            self.changed()
+
+    def can_start(self):
+        if not self.queue or len(self.running) >= self.max_running:
+            return False
+        # Paused jobs take free slots before queued jobs of the same or lower priority start
+        return not any(job.priority <= self.queue[0][0] for job in self.paused)
+
+    def run(self, job):
+        try:
+            job.checkpoint()
+            job.result = job.fn(job)
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.error = e
+            job.status = 'failed'
+            print(f"Job {job.name} failed: {e}")
+        finally:
+            with self.condition:
+                self.running.discard(job)
+                self.paused.discard(job)
+                self.forget(job)
+                self.condition.notify_all()
+            self.finish(job)
+
+    def finish(self, job):
+        job.finished.set()
+        if job.on_finished is not None:
+            try:
+                job.on_finished(job)
+            except Exception as e:
+                print(f"Error finishing job {job.name}: {e}")
+        self.changed()
+
+    def forget(self, job):
+        if job.key is not None and self.by_key.get(job.key) is job:
+            del self.by_key[job.key]
+
+    def outranked(self, job):
+        if self.queue and self.queue[0][0] < job.priority:
+            return True
+        return any(other.priority < job.priority for other in self.running)
+
+    def wait_for_turn(self, job):
+        with self.condition:
+            if job.cancelled or not self.outranked(job):
+                return
+            # Paused jobs do not count against max_running, so the outranking job can start
+            self.running.discard(job)
+            self.paused.add(job)
+            job.status = 'paused'
+            self.condition.notify_all()
+        self.changed()
+        with self.condition:
+            # Resume once nothing outranks the job and a slot is free (cancelled jobs resume to stop)
+            while not job.cancelled and (self.outranked(job) or len(self.running) >= self.max_running):
+                self.condition.wait()
+            self.paused.discard(job)
+            self.running.add(job)
+            job.status = 'running'
+        self.changed()
+
+    def cancel(self, job):
+        """Cancel a queued job now, or a running one at its next checkpoint"""
+        with self.condition:
+            job.cancel_event.set()
+            queued = any(entry[2] is job for entry in self.queue)
+            if queued:
+                self.queue = [entry for entry in self.queue if entry[2] is not job]
+                heapq.heapify(self.queue)
+                job.status = 'cancelled'
+                self.forget(job)
+            self.condition.notify_all()
+        if queued:
+            self.finish(job)
+        else:
+            self.changed()
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job)
+
+    def jobs(self):
+        """Active jobs, most urgent first: running, then paused, then queued"""
+        with self.condition:
+            active = sorted(self.running, key=lambda job: job.priority)
+            active += sorted(self.paused, key=lambda job: job.priority)
+            active += [entry[2] for entry in sorted(self.queue)]
+        return active
+
+    def add_listener(self, callback):
+        """callback(jobs) after every submit, start, pause, cancel and finish; called on the changing thread"""
+        self.listeners.append(callback)
+
+    def changed(self):
+        jobs = self.jobs()
+        for callback in self.listeners:
+            try:
+                callback(jobs)
+            except Exception as e:
+                print(f"Error in job listener: {e}")
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            self.cancel_all()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,208 @@
+from Imports import *
+from Snapshot import put_strings, get_strings
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.:/][a-z0-9]+)*")
+CHUNK_LABEL = re.compile(r"\ARows \d+ to \d+:\n")  # positional label, not part of the data
+
+
+def tokenize(text):
+    """Lowercase word tokens; compound identifiers like SKU-1042 also yield their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-_.:/]", token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def is_identifier(token):
+    """Tokens mixing letters and digits (SKU00123, a1-b2); plain numbers are values, not IDs"""
+    return len(token) >= 3 and any(c.isdigit() for c in token) and any(c.isalpha() for c in token)
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk text, stored as compact CSR posting arrays
+
+    Postings are appended as (term, doc, tf) triples and sorted into CSR form on
+    the next search. Replaced chunks are tombstoned rather than rewritten. A lock
+    lets searches run while the chunking thread is still adding documents.
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+        self.segments = []  # (terms, docs, tfs) arrays not yet merged into the CSR arrays
+        self.doc_len = np.empty(0, dtype=np.float32)
+        self.doc_chunk = np.empty(0, dtype=np.int64)
+        self.deleted = np.empty(0, dtype=bool)
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.empty(0, dtype=np.int32)
+        self.post_tfs = np.empty(0, dtype=np.float32)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return int((~self.deleted).sum())
+
+    def add(self, texts, positions=None):
+        """Index texts as documents for the given chunk positions (default: appended in order)"""
+        # Tokenize outside the lock so searches only wait for the append
+        counts = [Counter(tokenize(CHUNK_LABEL.sub("", text, count=1))) for text in texts]
+        with self.lock:
+            first_doc = len(self.doc_len)
+            if positions is None:
+                start = int(self.doc_chunk.max()) + 1 if len(self.doc_chunk) else 0
+                positions = range(start, start + len(texts))
+
+            terms, docs, tfs, lengths = [], [], [], []
+            for offset, doc_counts in enumerate(counts):
+                lengths.append(sum(doc_counts.values()))
+                for term, tf in doc_counts.items():
+                    term_id = self.vocab.setdefault(term, len(self.vocab))
+                    terms.append(term_id)
+                    docs.append(first_doc + offset)
+                    tfs.append(tf)
+
+            self.segments.append((
+                np.array(terms, dtype=np.int32),
+                np.array(docs, dtype=np.int32),
+                np.array(tfs, dtype=np.float32)
+            ))
+            self.doc_len = np.concatenate([self.doc_len, np.array(lengths, dtype=np.float32)])
+            self.doc_chunk = np.concatenate([self.doc_chunk, np.asarray(list(positions), dtype=np.int64)])
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(texts), dtype=bool)])
+
+    def update(self, positions, texts):
+        """Replace the documents indexed for the given chunk positions"""
+        with self.lock:
+            self.deleted |= np.isin(self.doc_chunk, positions)
+            self.add(texts, positions)
+
+    def merge_segments(self):
+        with self.lock:
+            if not self.segments:
+                return
+            term_counts = np.diff(self.term_offsets)
+            terms = np.concatenate([np.repeat(np.arange(len(term_counts), dtype=np.int32), term_counts)]
+                                   + [segment[0] for segment in self.segments])
+            docs = np.concatenate([self.post_docs] + [segment[1] for segment in self.segments])
+            tfs = np.concatenate([self.post_tfs] + [segment[2] for segment in self.segments])
+
+            # Drop postings of tombstoned documents while rebuilding
+            live = ~self.deleted[docs]
+            terms, docs, tfs = terms[live], docs[live], tfs[live]
+
+            order = np.argsort(terms, kind='stable')
+            self.post_docs = docs[order]
+            self.post_tfs = tfs[order]
+            self.term_offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self.vocab)))])
+            self.segments = []
+
+    def postings(self, term_id):
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.post_docs[start:end], self.post_tfs[start:end]
+
+    def query_terms(self, query):
+        return [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+
+    def scores(self, query):
+        """BM25 score of every document for the query"""
+        with self.lock:
+            self.merge_segments()
+            scores = np.zeros(len(self.doc_len), dtype=np.float32)
+            live = ~self.deleted
+            total = int(live.sum())
+            if not total:
+                return scores
+            avg_len = float(self.doc_len[live].mean()) or 1.0
+
+            for term_id in self.query_terms(query):
+                docs, tfs = self.postings(term_id)
+                if not len(docs):
+                    continue
+                idf = np.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / avg_len)
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            return scores
+
+    def search(self, query, k=3):
+        """Return (chunk positions, scores) of the k best BM25 matches"""
+        with self.lock:
+            scores = self.scores(query)
+            scores[self.deleted] = 0
+            best = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            best = best[scores[best] > 0]
+            return self.doc_chunk[best], scores[best]
+
+    def exact_matches(self, query, max_docs):
+        """Chunk positions containing every identifier-like query token (e.g. IDs, SKUs)
+
+        Returns an empty list unless the identifiers are selective enough to answer
+        the query on their own.
+        """
+        with self.lock:
+            self.merge_segments()
+            identifiers = [t for t in dict.fromkeys(tokenize(query)) if is_identifier(t)]
+            docs = None
+            for term in identifiers:
+                if term not in self.vocab:
+                    return []
+                term_docs = self.postings(self.vocab[term])[0]
+                term_docs = term_docs[~self.deleted[term_docs]]
+                docs = term_docs if docs is None else np.intersect1d(docs, term_docs)
+            if docs is None or not len(docs) or len(docs) > max_docs:
+                return []
+
+            scores = self.scores(query)[docs]
+            return self.doc_chunk[docs[np.argsort(-scores)]].tolist()
+
+    def save(self, path):
+        with self.lock:
+            self.merge_segments()
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "vocab.json"), 'w', encoding='utf-8') as f:
+                json.dump({'k1': self.k1, 'b': self.b, 'terms': list(self.vocab)}, f)
+            np.savez(
+                os.path.join(path, "postings.npz"),
+                doc_len=self.doc_len, doc_chunk=self.doc_chunk, deleted=self.deleted,
+                term_offsets=self.term_offsets, post_docs=self.post_docs, post_tfs=self.post_tfs
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "vocab.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(meta['k1'], meta['b'])
+        index.vocab = {term: i for i, term in enumerate(meta['terms'])}
+        with np.load(os.path.join(path, "postings.npz")) as arrays:
+            for name in ('doc_len', 'doc_chunk', 'deleted', 'term_offsets', 'post_docs', 'post_tfs'):
+                setattr(index, name, arrays[name])
+        return index
+
+    def snapshot(self):
+        """(meta, arrays) for a session snapshot"""
+        with self.lock:
+            self.merge_segments()
+            arrays = {name: getattr(self, name) for name in
+                      ('doc_len', 'doc_chunk', 'deleted', 'term_offsets', 'post_docs', 'post_tfs')}
+            put_strings(arrays, 'vocab', self.vocab)
+            return {'k1': self.k1, 'b': self.b}, arrays
+
+    @classmethod
+    def from_snapshot(cls, meta, arrays):
+        index = cls(meta['k1'], meta['b'])
+        index.vocab = {term: i for i, term in enumerate(get_strings(arrays, 'vocab'))}
+        for name in ('doc_len', 'doc_chunk', 'term_offsets', 'post_docs', 'post_tfs'):
+            setattr(index, name, arrays[name])
+        index.deleted = arrays['deleted'].copy()  # updated in place when chunks are replaced
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked id lists; ids ranked highly by any list come first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0) + 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,107 @@
+from Imports import *
+from ResponseCache import ResponseCache
+
+MAP_PROMPT = """Summarize this part of the dataset {filename} (columns: {columns}).
+Note value ranges, typical values, patterns and anomalies. Be brief.
+
+{text}"""
+
+REDUCE_PROMPT = """Merge these summaries of consecutive parts of the dataset {filename} into one concise summary.
+Keep the ranges, patterns and anomalies that matter for the dataset as a whole.
+
+{text}"""
+
+
+class MapReduceSummarizer:
+    """Summarizes every chunk: groups of chunks in parallel, then partial summaries merged in a tree
+
+    Partial summaries are cached by a hash of their prompt, so after an incremental
+    update only the groups containing changed chunks, and their ancestors, are regenerated.
+    """
+    CHARS_PER_TOKEN = 4
+    PROMPT_TOKENS = 128  # reserve for the instructions around the text
+
+    def __init__(self, chat, model, cache=None, context_tokens=4096, partial_tokens=256, workers=2, checkpoint=None):
+        self.chat = chat  # chat(messages, options) -> response text
+        self.checkpoint = checkpoint  # called before each model call; may block, or raise to stop
+        self.model = model
+        self.cache = cache
+        self.context_tokens = context_tokens
+        self.partial_tokens = partial_tokens
+        self.workers = workers
+        self.input_tokens = context_tokens - partial_tokens - self.PROMPT_TOKENS
+        self.fanin = max(2, self.input_tokens // partial_tokens)
+        self.generated = 0
+        self.reused = 0
+
+    @classmethod
+    def estimate_tokens(cls, text):
+        return len(text) // cls.CHARS_PER_TOKEN + 1
+
+    def group_size(self, chunks):
+        """Chunks per map call; based on the leading chunks so appends keep group boundaries stable"""
+        sample = sorted(self.estimate_tokens(chunk) for chunk in chunks[:100])
+        return max(1, self.input_tokens // sample[len(sample) // 2])
+
+    def summarize(self, chunks, filename="", columns=(), progress_callback=None):
+        """Partial summaries covering every chunk that together fit in the model context"""
+        if not chunks:
+            return []
+        columns = ", ".join(columns)
+        size = self.group_size(chunks)
+        prompts = [
+            MAP_PROMPT.format(filename=filename, columns=columns, text="\n\n".join(chunks[i:i + size]))
+            for i in range(0, len(chunks), size)
+        ]
+        partials = self.run(prompts, 0, progress_callback)
+
+        level = 0
+        while len(partials) > 1 and self.estimate_tokens("\n\n".join(partials)) > self.input_tokens:
+            level += 1
+            prompts = [
+                REDUCE_PROMPT.format(filename=filename, text="\n\n".join(partials[i:i + self.fanin]))
+                for i in range(0, len(partials), self.fanin)
+            ]
+            partials = self.run(prompts, level, progress_callback)
+        return partials
+
+    def key(self, prompt):
+        return ResponseCache.key(self.model, None, "map-reduce", [ResponseCache.chunk_id(prompt)])
+
+    def run(self, prompts, level, progress_callback=None):
+        """Summaries for prompts, from the cache where possible, generating the rest in parallel"""
+        results = [None] * len(prompts)
+        pending = []
+        for i, prompt in enumerate(prompts):
+            if self.cache is not None:
+                results[i] = self.cache.get(self.key(prompt))
+            if results[i] is None:
+                pending.append(i)
+        self.reused += len(prompts) - len(pending)
+
+        done = len(prompts) - len(pending)
+        if progress_callback:
+            progress_callback(level, done, len(prompts))
+        options = {'num_ctx': self.context_tokens, 'num_predict': self.partial_tokens}
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+                futures = {executor.submit(self.generate, prompts[i], options): i for i in pending}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    if self.cache is not None:
+                        self.cache.put(self.key(prompts[i]), results[i])
+                    self.generated += 1
+                    done += 1
+                    if progress_callback:
+                        progress_callback(level, done, len(prompts))
+        finally:
+            # Partials finished before a failure or cancellation are reused next time
+            if pending and self.cache is not None:
+                self.cache.save()
+        return results
+
+    def generate(self, prompt, options):
+        if self.checkpoint is not None:
+            self.checkpoint()
+        return self.chat([{'role': 'user', 'content': prompt}], options)
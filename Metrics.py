@@ -0,0 +1,265 @@
+from Imports import *
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class NullSpan:
+    """Shared do-nothing span returned while metrics are disabled"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.parent = None
+        self.start = 0.0
+        self.duration = None
+
+    def __enter__(self):
+        stack = self.metrics.stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        self.metrics.stack().pop()
+        self.metrics.finish(self)
+        return False
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets + (float('inf'),), itertools.accumulate(self.counts)):
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Process-wide spans, counters and histograms
+
+    Everything is a no-op until enable() is called: span() returns a shared
+    null context manager and count()/observe() return after one attribute check.
+    """
+    def __init__(self, recent_spans=1000):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counters = Counter()
+        self.histograms = {}
+        self.spans = deque(maxlen=recent_spans)
+        self.path = None
+        self.server = None
+        self.flusher = None
+        self.profile_dir = None
+        self.profile_armed = False
+
+    def enable(self, path=None, port=None, flush_interval=10.0):
+        """Start recording; write to path (.json snapshot, otherwise Prometheus text) and/or serve /metrics on port"""
+        self.enabled = True
+        self.path = path
+        if path:
+            atexit.register(self.write)
+            self.flusher = threading.Thread(target=self.flush_loop, args=(flush_interval,), daemon=True)
+            self.flusher.start()
+        if port is not None:
+            self.serve(port)
+        return self
+
+    def enable_from_env(self):
+        """Enable from SUMMARIZER_METRICS (file path) and/or SUMMARIZER_METRICS_PORT if either is set"""
+        path = os.environ.get('SUMMARIZER_METRICS')
+        port = os.environ.get('SUMMARIZER_METRICS_PORT')
+        if path or port:
+            self.enable(path=path, port=int(port) if port else None)
+        return self.enabled
+
+    def disable(self):
+        self.enabled = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.spans.clear()
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def span(self, name):
+        """Context manager timing a stage; nested spans record their parent"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def timed(self, name):
+        """Decorator recording each call of a function as a span"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with Span(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def finish(self, span):
+        with self.lock:
+            self.histogram(span.name + '.seconds').observe(span.duration)
+            self.spans.append({
+                'name': span.name, 'parent': span.parent, 'seconds': span.duration,
+                'thread': threading.current_thread().name, 'time': time.time() - span.duration
+            })
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.histogram(name).observe(value)
+
+    def arm_profile(self, directory="."):
+        """Profile the next profiled() block with cProfile and save its stats to directory"""
+        self.profile_dir = directory
+        self.profile_armed = True
+
+    @contextlib.contextmanager
+    def profiled(self, name):
+        """Run the block under cProfile if a profile was armed; otherwise just run it"""
+        if not self.profile_armed:
+            yield
+            return
+        self.profile_armed = False
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"profile-{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+            profiler.dump_stats(path)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(15)
+            print(f"Profile of {name} saved to {path}\n{stream.getvalue()}")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {
+                    name: {'count': h.count, 'sum': h.sum, 'p50': h.quantile(0.5), 'p95': h.quantile(0.95),
+                           'buckets': dict(zip([str(b) for b in h.buckets] + ['+Inf'], h.counts))}
+                    for name, h in self.histograms.items()
+                },
+                'recent_spans': list(self.spans),
+            }
+
+    @staticmethod
+    def metric_name(name):
+        return "summarizer_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = self.metric_name(name) + "_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, h in sorted(self.histograms.items()):
+                metric = self.metric_name(name)
+                lines.append(f"# TYPE {metric} histogram")
+                for bound, cumulative in zip(h.buckets + ('+Inf',), itertools.accumulate(h.counts)):
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f"{metric}_sum {h.sum}", f"{metric}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        text = json.dumps(self.snapshot(), indent=2) if path.endswith('.json') else self.prometheus_text()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def flush_loop(self, interval):
+        while self.enabled:
+            time.sleep(interval)
+            try:
+                self.write()
+            except Exception as e:
+                print(f"Error writing metrics to {self.path}: {e}")
+
+    def serve(self, port, host='127.0.0.1'):
+        """Expose Prometheus text at http://host:port/metrics from a background thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200 if self.path in ('/', '/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+
+metrics = Metrics()
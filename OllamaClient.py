@@ -0,0 +1,200 @@
+from Imports import *
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class OllamaClient:
+    """Shared HTTP client for one or more Ollama endpoints
+
+    Keeps a keep-alive connection pool, limits concurrent requests with a
+    semaphore, applies timeouts, retries failed requests with exponential
+    backoff and sends each request to the least busy healthy endpoint.
+    """
+    shared_instance = None
+    shared_lock = threading.Lock()
+
+    def __init__(self, endpoints=None, max_concurrency=8, timeout=(5, 300), retries=3, backoff=0.5, cooldown=5.0,
+                 keep_alive=None):
+        self.endpoints = [self.normalize_endpoint(e) for e in (endpoints or [OLLAMA_ADDRESS])]
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout  # (connect, read) seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.cooldown = cooldown  # seconds a failed endpoint is only used when no other is available
+        self.keep_alive = keep_alive  # how long servers keep models loaded after a request, e.g. "30m"
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.in_flight = {endpoint: 0 for endpoint in self.endpoints}
+        self.failures = {endpoint: 0 for endpoint in self.endpoints}  # consecutive failures
+        self.failed_at = {endpoint: 0.0 for endpoint in self.endpoints}
+
+    @classmethod
+    def shared(cls):
+        """The process-wide client, created with defaults on first use"""
+        with cls.shared_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+            return cls.shared_instance
+
+    @classmethod
+    def configure(cls, **kwargs):
+        """Replace the process-wide client, e.g. with more endpoints or a different concurrency limit"""
+        with cls.shared_lock:
+            if cls.shared_instance is not None:
+                cls.shared_instance.close()
+            cls.shared_instance = cls(**kwargs)
+            return cls.shared_instance
+
+    @staticmethod
+    def normalize_endpoint(endpoint):
+        endpoint = endpoint.strip().rstrip('/')
+        return endpoint if '://' in endpoint else f"http://{endpoint}"
+
+    def close(self):
+        self.session.close()
+
+    def acquire_endpoint(self, exclude=(), pinned=None):
+        """Least busy endpoint, avoiding ones that failed within the cooldown"""
+        now = time.monotonic()
+        with self.lock:
+            if pinned is not None:
+                self.in_flight.setdefault(pinned, 0)
+                self.failures.setdefault(pinned, 0)
+                self.failed_at.setdefault(pinned, 0.0)
+                self.in_flight[pinned] += 1
+                return pinned
+            candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+            endpoint = min(candidates, key=lambda e: (
+                self.failures[e] > 0 and now - self.failed_at[e] < self.cooldown, self.in_flight[e]
+            ))
+            self.in_flight[endpoint] += 1
+            return endpoint
+
+    def release_endpoint(self, endpoint, ok):
+        with self.lock:
+            self.in_flight[endpoint] -= 1
+            self.failures[endpoint] = 0 if ok else self.failures[endpoint] + 1
+            if not ok:
+                self.failed_at[endpoint] = time.monotonic()
+
+    @staticmethod
+    def retryable(error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and response.status_code in RETRY_STATUS
+
+    def should_retry(self, error, endpoint, attempt, retries, tried):
+        if attempt == retries or not self.retryable(error):
+            return False
+        print(f"Ollama request to {endpoint} failed (attempt {attempt + 1}): {error}")
+        tried.append(endpoint)
+        return True
+
+    def with_keep_alive(self, payload):
+        if self.keep_alive is not None:
+            payload['keep_alive'] = self.keep_alive
+        return payload
+
+    def request(self, path, payload, retries=None, backoff=None, endpoint=None):
+        """POST to the least busy endpoint and return the decoded JSON, retrying on another endpoint
+
+        endpoint pins the request to one server, e.g. to warm up that server.
+        """
+        retries = self.retries if retries is None else retries
+        backoff = self.backoff if backoff is None else backoff
+        tried = []
+        pinned = self.normalize_endpoint(endpoint) if endpoint else None
+        for attempt in range(retries + 1):
+            with self.semaphore:
+                endpoint = self.acquire_endpoint(exclude=tried, pinned=pinned)
+                ok = False
+                try:
+                    response = self.session.post(endpoint + path, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    result = response.json()
+                    ok = True
+                    return result
+                except Exception as e:
+                    # Bad requests (e.g. 404 for an unknown model) say nothing about the endpoint's health
+                    ok = not self.retryable(e)
+                    if not self.should_retry(e, endpoint, attempt, retries, tried):
+                        raise
+                finally:
+                    self.release_endpoint(endpoint, ok)
+            time.sleep(backoff * (2 ** attempt))
+
+    def stream(self, path, payload, retries=None, backoff=None):
+        """Like request, but yields each JSON line of a streamed response
+
+        The concurrency slot is held until the stream is consumed. Only failures
+        before the first line are retried, so no output is ever repeated.
+        """
+        retries = self.retries if retries is None else retries
+        backoff = self.backoff if backoff is None else backoff
+        tried = []
+        for attempt in range(retries + 1):
+            with self.semaphore:
+                endpoint = self.acquire_endpoint(exclude=tried)
+                ok = produced = False
+                try:
+                    with self.session.post(endpoint + path, json=payload, stream=True, timeout=self.timeout) as response:
+                        response.raise_for_status()
+                        for line in response.iter_lines():
+                            if line:
+                                produced = True
+                                yield json.loads(line)
+                    ok = True
+                    return
+                except GeneratorExit:
+                    # The caller stopped reading (e.g. a cancelled job); the endpoint is fine
+                    ok = True
+                    raise
+                except Exception as e:
+                    ok = not self.retryable(e)
+                    if produced or not self.should_retry(e, endpoint, attempt, retries, tried):
+                        raise
+                finally:
+                    self.release_endpoint(endpoint, ok)
+            time.sleep(backoff * (2 ** attempt))
+
+    def embed(self, model, input, **kwargs):
+        """Batch embeddings: {'embeddings': [[...], ...]}"""
+        return self.request('/api/embed', self.with_keep_alive({'model': model, 'input': input}), **kwargs)
+
+    def embeddings(self, model, prompt, **kwargs):
+        """Single embedding: {'embedding': [...]}"""
+        return self.request('/api/embeddings', self.with_keep_alive({'model': model, 'prompt': prompt}), **kwargs)
+
+    def chat(self, model, messages, options=None, stream=False, **kwargs):
+        """Chat response, or an iterator of partial responses when stream=True"""
+        payload = self.with_keep_alive({'model': model, 'messages': messages, 'stream': stream})
+        if options:
+            payload['options'] = options
+        if stream:
+            return self.stream('/api/chat', payload, **kwargs)
+        return self.request('/api/chat', payload, **kwargs)
+
+    def preload(self, model, endpoint, embedding=False):
+        """Load a model on one server so the first real request does not pay the load time"""
+        if embedding:
+            payload = {'model': model, 'input': ""}
+            return self.request('/api/embed', self.with_keep_alive(payload), endpoint=endpoint, retries=1)
+        # A generate request without a prompt only loads the model
+        return self.request('/api/generate', self.with_keep_alive({'model': model}), endpoint=endpoint, retries=1)
+
+    def is_healthy(self, endpoint=None, timeout=1):
+        """True if the endpoint (default: the first) answers; uses the pool but not the semaphore"""
+        try:
+            response = self.session.get(self.normalize_endpoint(endpoint or self.endpoints[0]), timeout=timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {e: {'in_flight': self.in_flight[e], 'failures': self.failures[e]} for e in self.endpoints}
@@ -1,41 +1,63 @@
 from Imports import *
+from OllamaClient import OllamaClient
 
 class OllamaServer:
-    def __init__(self):
+    """One `ollama serve` process bound to address (or an already running server there)"""
+    def __init__(self, address=OLLAMA_ADDRESS, command=None):
+        self.address = OllamaClient.normalize_endpoint(address)
+        self.command = command or ['ollama', 'serve']
         self.process = None
-    
+        self.restarts = 0
+
     def start(self, timeout=10):
         """Start Ollama server with timeout"""
         try:
             if self.is_running():
                 return True
-            
+
+            # OLLAMA_HOST selects the address the server listens on
+            env = dict(os.environ, OLLAMA_HOST=self.address.split('://', 1)[-1])
             self.process = subprocess.Popen(
-                ['ollama', 'serve'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                self.command,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
                 preexec_fn=os.setsid if hasattr(os, 'setsid') else None
             )
-            
+
+            # Poll quickly at first, backing off to 0.5 s
             start_time = time.time()
+            delay = 0.05
             while time.time() - start_time < timeout:
                 if self.is_running():
                     return True
-                time.sleep(0.5)
-            
+                if self.process.poll() is not None:
+                    print(f"Ollama at {self.address} exited with code {self.process.returncode}")
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
             return False
-            
+
         except Exception as e:
             print(f"Error starting Ollama: {e}")
             return False
-    
+
     def is_running(self):
-        try:
-            response = requests.get(OLLAMA_ADDRESS, timeout=1)
-            return response.status_code == 200
-        except:
+        # Reuses the shared client's pooled connection instead of opening one per check
+        return OllamaClient.shared().is_healthy(self.address)
+
+    def is_alive(self):
+        """Running, and if this object started the process, the process has not exited"""
+        if self.process is not None and self.process.poll() is not None:
             return False
-    
+        return self.is_running()
+
+    def restart(self, timeout=10):
+        self.stop()
+        self.restarts += 1
+        return self.start(timeout)
+
     def stop(self):
         if self.process:
             self.process.terminate()
@@ -43,3 +65,99 @@ class OllamaServer:
                 self.process.wait(timeout=5)
             except:
                 self.process.kill()
+            self.process = None
+
+
+class OllamaServerPool:
+    """N Ollama servers on consecutive ports, health-checked, restarted on crash and pre-warmed
+
+    The shared OllamaClient is pointed at every server so requests are balanced across them.
+    """
+    def __init__(self, size=1, address=OLLAMA_ADDRESS, models=(), embedding_models=(),
+                 keep_alive='30m', check_interval=5.0, command=None, max_concurrency=None):
+        # Servers listen on address's port and the ports after it
+        base = urlsplit(OllamaClient.normalize_endpoint(address))
+        port = base.port or 11434
+        self.servers = [
+            OllamaServer(f"{base.scheme}://{base.hostname}:{port + i}", command) for i in range(max(1, size))
+        ]
+        self.models = list(models)
+        self.embedding_models = list(embedding_models)
+        self.keep_alive = keep_alive
+        self.check_interval = check_interval
+        self.max_concurrency = max_concurrency or 8 * len(self.servers)
+        self.stopping = threading.Event()
+        self.monitor_thread = None
+
+    @property
+    def addresses(self):
+        return [server.address for server in self.servers]
+
+    def start(self, timeout=10):
+        """Start every server in parallel; True if at least one is up"""
+        OllamaClient.configure(
+            endpoints=self.addresses,
+            max_concurrency=self.max_concurrency,
+            keep_alive=self.keep_alive
+        )
+        with ThreadPoolExecutor(max_workers=len(self.servers)) as executor:
+            started = list(executor.map(lambda server: server.start(timeout), self.servers))
+
+        for server, ok in zip(self.servers, started):
+            if ok:
+                threading.Thread(target=self.warm_up, args=(server,), daemon=True).start()
+
+        self.stopping.clear()
+        self.monitor_thread = threading.Thread(target=self.monitor, daemon=True)
+        self.monitor_thread.start()
+        return any(started)
+
+    # Kept so the pool can stand in wherever a single OllamaServer was used
+    def is_running(self):
+        return any(server.is_running() for server in self.servers)
+
+    def warm_up(self, server, models=None, embedding_models=None):
+        """Load models (default: the configured ones) on one server and keep them resident"""
+        client = OllamaClient.shared()
+        models = self.models if models is None else models
+        embedding_models = self.embedding_models if embedding_models is None else embedding_models
+        for model, embedding in [(m, False) for m in models] + [(m, True) for m in embedding_models]:
+            try:
+                client.preload(model, server.address, embedding=embedding)
+            except Exception as e:
+                print(f"Error warming up {model} on {server.address}: {e}")
+
+    def add_model(self, model, embedding=False):
+        """Warm up a newly selected model on every server in the background"""
+        models = self.embedding_models if embedding else self.models
+        if model in models:
+            return
+        models.append(model)
+        for server in self.servers:
+            args = (server, [], [model]) if embedding else (server, [model], [])
+            threading.Thread(target=self.warm_up, args=args, daemon=True).start()
+
+    def monitor(self):
+        """Restart servers that crashed or stopped answering health checks"""
+        while not self.stopping.wait(self.check_interval):
+            for server in self.servers:
+                if self.stopping.is_set():
+                    return
+                if not server.is_alive():
+                    print(f"Ollama at {server.address} is down; restarting")
+                    if server.restart():
+                        self.warm_up(server)
+
+    def stop(self):
+        """Stop health checks, then shut every server down gracefully"""
+        self.stopping.set()
+        if self.monitor_thread is not None:
+            self.monitor_thread.join(timeout=self.check_interval + 1)
+        with ThreadPoolExecutor(max_workers=len(self.servers)) as executor:
+            list(executor.map(lambda server: server.stop(), self.servers))
+
+    def status(self):
+        return [
+            {'address': server.address, 'alive': server.is_alive(), 'restarts': server.restarts}
+            for server in self.servers
+        ]
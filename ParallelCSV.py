@@ -0,0 +1,117 @@
+from Imports import *
+from ColumnTable import ColumnTable
+from RowIndex import QUOTE, NEWLINE
+
+
+def next_record_start(f, offset, in_quotes, block_size=1 << 16):
+    """First record boundary after offset, given whether offset lies inside a quoted field"""
+    f.seek(offset)
+    position = offset
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return position
+        data = np.frombuffer(block, dtype=np.uint8)
+        parity = (np.cumsum(data == QUOTE, dtype=np.uint8) + in_quotes) & 1
+        ends = np.flatnonzero((data == NEWLINE) & (parity == 0))
+        if len(ends):
+            return position + int(ends[0]) + 1
+        in_quotes = int(parity[-1])
+        position += len(block)
+
+
+def count_quotes(path, start, end, block_size=1 << 24):
+    """Worker: number of quote characters in the byte range [start, end)"""
+    count = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            count += block.count(b'"')
+            remaining -= len(block)
+    return count
+
+
+def read_lines(path, start, end):
+    """Decoded lines of [start, end); both ends must be record boundaries"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        for line in f:
+            if remaining <= 0:
+                return
+            remaining -= len(line)
+            yield line.decode('utf-8')
+
+
+def parse_range(path, start, end, headers, stream=False, preview_rows=0):
+    """Worker: parse one byte range into a ColumnTable, or per-column aggregates when streaming
+
+    Returns (table or aggregates, row count, the first preview_rows rows when streaming).
+    """
+    reader = csv.reader(read_lines(path, start, end))
+    if not stream:
+        rows = list(reader)
+        return ColumnTable.from_rows(headers, rows), len(rows), []
+
+    from CSVParser import RunningStats  # CSVParser imports this module
+    aggregates = [RunningStats() for _ in headers]
+    preview = []
+    count = 0
+    for row in reader:
+        if count < preview_rows:
+            preview.append(row)
+        count += 1
+        for aggregate, value in zip(aggregates, row):
+            aggregate.add(value)
+    return aggregates, count, preview
+
+
+def split_ranges(path, start, size, parts, executor):
+    """Split [start, size) into up to parts byte ranges that each begin and end on a record boundary
+
+    Quotes are counted per range in parallel; the running parity at each cut tells
+    whether it falls inside a quoted field, so the cut moves to the next newline
+    outside quotes.
+    """
+    cuts = [start + (size - start) * i // parts for i in range(parts + 1)]
+    counts = list(executor.map(count_quotes, itertools.repeat(path), cuts[:-1], cuts[1:]))
+    bounds = [start]
+    quotes = 0
+    with open(path, 'rb') as f:
+        for cut, count in zip(cuts[1:-1], counts):
+            quotes += count
+            bounds.append(max(bounds[-1], next_record_start(f, cut, quotes & 1)))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def load_parallel(path, workers, stream=False, preview_rows=20, ranges_per_worker=4, progress_callback=None):
+    """Parse a CSV on a process pool; returns (headers, parse_range results in file order, size)"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        data_start = next_record_start(f, 0, 0)
+        f.seek(0)
+        header = f.read(data_start).decode('utf-8')
+    headers = next(csv.reader(io.StringIO(header, newline='')), [])
+
+    # Spawned workers are safe to start from the GUI's loader thread, unlike forked ones
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        ranges = split_ranges(path, data_start, size, workers * ranges_per_worker, executor)
+        futures = {
+            executor.submit(parse_range, path, a, b, headers, stream, preview_rows): i
+            for i, (a, b) in enumerate(ranges)
+        }
+        results = [None] * len(ranges)
+        done = data_start
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            done += ranges[i][1] - ranges[i][0]
+            if progress_callback:
+                progress_callback(done, size)
+    return headers, results, size
@@ -0,0 +1,302 @@
+from Imports import *
+from ColumnTable import ColumnTable
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def mix64(values):
+    """splitmix64 finalizer over a uint64 array"""
+    with np.errstate(over='ignore'):
+        z = values.astype(np.uint64, copy=True)
+        z ^= z >> np.uint64(30)
+        z *= np.uint64(0xbf58476d1ce4e5b9)
+        z ^= z >> np.uint64(27)
+        z *= np.uint64(0x94d049bb133111eb)
+        z ^= z >> np.uint64(31)
+    return z
+
+
+def hash_strings(strings):
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(str(s).encode('utf-8'), digest_size=8).digest(), 'little') for s in strings],
+        dtype=np.uint64
+    )
+
+
+class ColumnProfile:
+    """Mergeable profile of one column: moments, nulls, quantile sample and distinct sketch"""
+    SAMPLE_SIZE = 4096
+    SKETCH_SIZE = 1024
+
+    def __init__(self, name):
+        self.name = name
+        self.numeric = True
+        self.count = 0
+        self.nulls = 0
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sample = np.empty(0)
+        self.sample_priority = np.empty(0, dtype=np.uint64)
+        self.sketch = np.empty(0, dtype=np.uint64)
+        self.salt = hash_strings([name])[0]
+
+    def add_column(self, column, first_row):
+        """Fold in one typed column block in a single vectorized pass"""
+        if column.kind == 'text':
+            self.numeric = False
+            present = column.categories[column.values] != ''
+            self.count += int(present.sum())
+            self.nulls += int((~present).sum())
+            category_hashes = hash_strings(column.categories)
+            self.add_hashes(category_hashes[column.values[present]])
+            return
+
+        values = column.values.astype(np.float64, copy=False)
+        present = ~np.isnan(values)
+        numbers = values[present]
+        self.count += len(numbers)
+        self.nulls += int(len(values) - len(numbers))
+        if not len(numbers):
+            return
+
+        self.merge_moments(len(numbers), float(numbers.mean()), float(((numbers - numbers.mean()) ** 2).sum()))
+        self.min = float(numbers.min()) if self.min is None else min(self.min, float(numbers.min()))
+        self.max = float(numbers.max()) if self.max is None else max(self.max, float(numbers.max()))
+        self.add_hashes(mix64(numbers.view(np.uint64)))
+
+        rows = np.arange(first_row, first_row + len(values), dtype=np.uint64)[present]
+        self.add_sample(numbers, mix64(rows ^ self.salt))
+
+    def merge_moments(self, count, mean, m2):
+        total = self.numeric_count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.numeric_count * count / total
+        self.numeric_count = total
+
+    def add_hashes(self, hashes):
+        """Keep the SKETCH_SIZE smallest distinct hashes (k-minimum-values sketch)"""
+        merged = np.unique(np.concatenate([self.sketch, hashes]))
+        self.sketch = merged[:self.SKETCH_SIZE]
+
+    def add_sample(self, values, priorities):
+        """Bottom-k priority sample, which stays uniform when merged"""
+        values = np.concatenate([self.sample, values])
+        priorities = np.concatenate([self.sample_priority, priorities])
+        if len(values) > self.SAMPLE_SIZE:
+            keep = np.argpartition(priorities, self.SAMPLE_SIZE - 1)[:self.SAMPLE_SIZE]
+            values, priorities = values[keep], priorities[keep]
+        self.sample, self.sample_priority = values, priorities
+
+    def merge(self, other):
+        self.numeric = self.numeric and other.numeric
+        self.count += other.count
+        self.nulls += other.nulls
+        if other.numeric_count:
+            self.merge_moments(other.numeric_count, other.mean, other.m2)
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+            self.add_sample(other.sample, other.sample_priority)
+        self.add_hashes(other.sketch)
+
+    def distinct(self):
+        if len(self.sketch) < self.SKETCH_SIZE:
+            return len(self.sketch)
+        return int((self.SKETCH_SIZE - 1) * 2.0 ** 64 / float(self.sketch[-1]))
+
+    def to_dict(self):
+        profile = {
+            'type': 'numeric' if self.numeric and self.numeric_count else 'text',
+            'count': self.count,
+            'nulls': self.nulls,
+            'distinct': self.distinct(),
+        }
+        if profile['type'] == 'numeric':
+            profile.update({
+                'mean': self.mean,
+                'std': (self.m2 / (self.numeric_count - 1)) ** 0.5 if self.numeric_count > 1 else 0,
+                'min': self.min,
+                'max': self.max,
+                'quantiles': dict(zip(QUANTILES, np.quantile(self.sample, QUANTILES).tolist())),
+            })
+        return profile
+
+    def state(self):
+        return {
+            'name': self.name, 'numeric': self.numeric, 'count': self.count, 'nulls': self.nulls,
+            'numeric_count': self.numeric_count, 'mean': self.mean, 'm2': self.m2,
+            'min': self.min, 'max': self.max,
+            'sample': self.sample.tolist(), 'sample_priority': [int(p) for p in self.sample_priority],
+            'sketch': [int(h) for h in self.sketch],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        profile = cls(state['name'])
+        profile.numeric = state['numeric']
+        profile.count = state['count']
+        profile.nulls = state['nulls']
+        profile.numeric_count = state['numeric_count']
+        profile.mean = state['mean']
+        profile.m2 = state['m2']
+        profile.min = state['min']
+        profile.max = state['max']
+        profile.sample = np.array(state['sample'], dtype=np.float64)
+        profile.sample_priority = np.array(state['sample_priority'], dtype=np.uint64)
+        profile.sketch = np.array(state['sketch'], dtype=np.uint64)
+        return profile
+
+
+class DatasetProfile:
+    """Profiles for every column of one file, plus the byte offset they cover"""
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self.columns = {header: ColumnProfile(header) for header in self.headers}
+        self.row_count = 0
+        self.offset = 0
+
+    def add_table(self, table):
+        for column in table.columns:
+            self.columns[column.name].add_column(column, self.row_count)
+        self.row_count += len(table)
+
+    def add_rows(self, rows, block_size=65536):
+        """Profile an iterable of rows block by block"""
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) == block_size:
+                self.add_table(ColumnTable.from_rows(self.headers, block))
+                block = []
+        if block:
+            self.add_table(ColumnTable.from_rows(self.headers, block))
+
+    def numeric_columns(self):
+        return [h for h in self.headers if self.columns[h].to_dict()['type'] == 'numeric']
+
+    def to_dict(self):
+        return {header: self.columns[header].to_dict() for header in self.headers}
+
+    def state(self):
+        return {
+            'headers': self.headers, 'row_count': self.row_count, 'offset': self.offset,
+            'columns': [self.columns[h].state() for h in self.headers],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        profile = cls(state['headers'])
+        profile.row_count = state['row_count']
+        profile.offset = state['offset']
+        profile.columns = {c['name']: ColumnProfile.from_state(c) for c in state['columns']}
+        return profile
+
+
+class Profiler:
+    """Builds column profiles and caches them per file, extending them when rows are appended"""
+    HEAD_BYTES = 65536
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.expanduser("~"), ".cache", "document-summarizer", "profiles"
+        )
+        self.memory = {}
+
+    def profile(self, parser):
+        path = os.path.abspath(parser.filepath)
+        stat = os.stat(path)
+        signature = self.signature(path, stat)
+
+        cached = self.memory.get(path) or self.load(path)
+        if cached is not None:
+            cached_signature, profile = cached
+            if cached_signature == signature and profile.headers == parser.headers:
+                self.memory[path] = cached
+                return profile
+            if self.is_append(path, cached_signature, signature, profile, parser):
+                self.extend(path, profile)
+                profile.offset = stat.st_size
+                return self.store(path, signature, profile)
+
+        profile = DatasetProfile(parser.headers)
+        if parser.table is not None:
+            profile.add_table(parser.table)
+        else:
+            profile.add_rows(parser.iter_rows())
+        profile.offset = stat.st_size
+        return self.store(path, signature, profile)
+
+    def signature(self, path, stat):
+        head_len = min(stat.st_size, self.HEAD_BYTES)
+        return {
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'head_len': head_len, 'head': self.head_hash(path, head_len),
+            'complete': self.ends_with_newline(path, stat.st_size),
+        }
+
+    def remember(self, parser, profile):
+        """Use a profile restored from elsewhere (e.g. a session snapshot) for the file as it is now"""
+        path = os.path.abspath(parser.filepath)
+        self.memory[path] = (self.signature(path, os.stat(path)), profile)
+        return profile
+
+    def is_append(self, path, old, new, profile, parser):
+        """True when the file only grew past the bytes the cached profile covers
+
+        As in CSVParser.detect_change, the covered bytes must end in a newline;
+        otherwise the appended bytes continue the last record.
+        """
+        return (
+            profile.headers == parser.headers
+            and old.get('complete', False)
+            and new['size'] > old['size'] == profile.offset
+            and self.head_hash(path, old['head_len']) == old['head']
+        )
+
+    def extend(self, path, profile):
+        """Profile only the rows appended since the cached profile was built"""
+        with open(path, 'rb') as f:
+            f.seek(profile.offset)
+            tail = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            profile.add_rows(csv.reader(tail))
+
+    @staticmethod
+    def ends_with_newline(path, size):
+        if not size:
+            return True
+        with open(path, 'rb') as f:
+            f.seek(size - 1)
+            return f.read(1) == b"\n"
+
+    def head_hash(self, path, length):
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read(length)).hexdigest()
+
+    def cache_path(self, path):
+        return os.path.join(self.cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + ".json")
+
+    def load(self, path):
+        try:
+            with open(self.cache_path(path), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            return cached['signature'], DatasetProfile.from_state(cached['profile'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading cached profile for {path}: {e}")
+            return None
+
+    def store(self, path, signature, profile):
+        self.memory[path] = (signature, profile)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self.cache_path(path) + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'path': path, 'signature': signature, 'profile': profile.state()}, f)
+            os.replace(tmp_path, self.cache_path(path))
+        except Exception as e:
+            print(f"Error caching profile for {path}: {e}")
+        return profile
@@ -0,0 +1,353 @@
+from Imports import *
+
+AGGREGATE_WORDS = [
+    ('count', ('how many', 'number of', 'count of', 'count')),
+    ('mean', ('average', 'mean', 'avg')),
+    ('median', ('median',)),
+    ('sum', ('total', 'sum')),
+    ('max', ('maximum', 'max', 'highest', 'largest', 'biggest')),
+    ('min', ('minimum', 'min', 'lowest', 'smallest')),
+]
+GROUP_WORDS = r"(?:by|per|for each|each|across|grouped by)"
+COMPARISONS = [
+    ('>=', ('>=', 'at least')),
+    ('<=', ('<=', 'at most')),
+    ('>', ('>', 'greater than', 'more than', 'over', 'above')),
+    ('<', ('<', 'less than', 'under', 'below')),
+    ('==', ('=', '==', 'equal to', 'equals')),
+]
+TARGET_WORDS = r"\b(?:which|who|whose)\b"
+# Words that introduce a condition; the words after them must have been parsed as a filter or group
+QUALIFIER_WORDS = {
+    'in', 'during', 'since', 'before', 'after', 'between', 'from', 'where', 'with', 'without', 'except',
+    'excluding', 'not', 'only', 'last', 'first', 'top', 'bottom', 'when', 'that', 'for', 'of', 'by', 'per',
+    'each', 'across', 'within', 'on', 'at',
+}
+FILLER_WORDS = {'the', 'a', 'an', 'all', 'this', 'these', 'data', 'dataset', 'file', 'table', 'csv', 'rows',
+                'records', 'entries', 'items', 'values', 'overall', 'total', 'whole', 'entire'}
+# Question words that carry no condition; any other word left over sends the question to retrieval
+QUESTION_WORDS = {
+    'what', "what's", 'whats', 'which', 'who', 'whose', 'how', 'many', 'much', 'is', 'are', 'was', 'were',
+    'there', 'do', 'does', 'did', 'we', 'i', 'you', 'it', 'its', 'have', 'has', 'had', 'can', 'could',
+    'please', 'show', 'me', 'tell', 'give', 'get', 'find', 'compute', 'calculate', 'and', 'or', 'to',
+    'value', 'number', 'amount', 'row', 'record', 'entry',
+}
+DISTINCT_WORDS = r"\b(?:unique|distinct|different)\b"
+MAX_GROUPS = 20
+MAX_ROWS = 5
+MAX_FILTER_CATEGORIES = 1000
+
+
+class QueryPlan:
+    """Aggregate over one column, optionally filtered and grouped"""
+    def __init__(self, aggregate, column=None, group_by=None, filters=None):
+        self.aggregate = aggregate
+        self.column = column
+        self.group_by = group_by
+        self.filters = filters or []  # (column, op, value)
+
+    def describe(self):
+        if self.aggregate in ('argmax', 'argmin'):
+            target = f"rows with the {'highest' if self.aggregate == 'argmax' else 'lowest'} {self.column}"
+        else:
+            target = f"{self.aggregate}({self.column})" if self.column else "count(rows)"
+            if self.aggregate == 'distinct':
+                target = f"count(distinct {self.column})"
+        text = target + (f" grouped by {self.group_by}" if self.group_by else "")
+        if self.filters:
+            text += " where " + " and ".join(self.describe_filter(*f) for f in self.filters)
+        return text
+
+    @staticmethod
+    def describe_filter(column, op, value):
+        if op == 'in':
+            return f"{column} in ({', '.join(map(str, value))})"
+        return f"{column} {op} {value}"
+
+
+class QueryPlanner:
+    """Recognises aggregate, filter and group-by questions and computes them over all rows"""
+    def __init__(self, data):
+        self.data = data
+        self.numeric = set(data.get_numeric_columns())
+        self.patterns = sorted(
+            ((self.column_pattern(h), h) for h in data.headers),
+            key=lambda item: -len(item[1])
+        )
+
+    @staticmethod
+    def column_pattern(header):
+        words = re.split(r"[\s_\-]+", header.strip().lower())
+        return re.compile(r"\b" + r"[\s_\-]+".join(map(re.escape, words)) + r"s?\b")
+
+    def mention_spans(self, text):
+        """(column, span) for every column named in text"""
+        spans = []
+        for pattern, header in self.patterns:
+            for match in pattern.finditer(text):
+                # Skip matches inside a longer header already found, e.g. "price" in "unit price"
+                if any(s <= match.start() < e for _, (s, e) in spans):
+                    continue
+                spans.append((header, match.span()))
+        return spans
+
+    def mentions(self, text):
+        """Columns named in text, in order of first appearance"""
+        found = {}
+        for header, (start, _) in self.mention_spans(text):
+            found.setdefault(header, start)
+        return sorted(found, key=found.get)
+
+    def plan(self, question):
+        """QueryPlan for the question, or None unless every condition in it was understood
+
+        Questions asking which row or entity (which/who) are only planned for a plain
+        max/min, answered with the matching rows; anything else falls back to retrieval.
+        """
+        text = question.lower()
+        consumed = []
+        aggregate = None
+        for name, words in AGGREGATE_WORDS:
+            match = re.search(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b", text)
+            if match:
+                aggregate = name
+                consumed.append(match.span())
+                break
+        if aggregate is None:
+            return None
+
+        distinct = re.search(DISTINCT_WORDS, text)
+        if distinct:
+            # Only "how many unique <column>" is computed; other uses of "unique" go to retrieval
+            if aggregate != 'count':
+                return None
+            aggregate = 'distinct'
+            consumed.append(distinct.span())
+
+        spans = self.mention_spans(text)
+        consumed += [span for _, span in spans]
+
+        group_by = None
+        for group_match in re.finditer(r"\b" + GROUP_WORDS + r"\s+", text):
+            grouped = [h for h, span in spans if span[0] == group_match.end()]
+            if grouped:
+                group_by = grouped[0]
+                consumed.append(group_match.span())
+                break
+
+        filters = self.numeric_filters(text, consumed) + self.category_filters(text, group_by, consumed)
+        filtered = {c for c, _, _ in filters}
+
+        # Several values of one column are alternatives ("apple and pear"), not all required at once
+        equal = {}
+        for c, op, v in filters:
+            if op == '==':
+                equal.setdefault(c, []).append(v)
+        filters = [f for f in filters if f[1] != '=='] + [
+            (c, '==', values[0]) if len(values) == 1 else (c, 'in', values) for c, values in equal.items()
+        ]
+
+        if self.unparsed(text, consumed):
+            return None
+
+        targeted = re.search(TARGET_WORDS, text) or any(
+            h not in self.numeric and re.search(r"\bwhat\s+$", text[:span[0]]) for h, span in spans
+        )
+        if targeted:
+            if aggregate not in ('max', 'min') or group_by:
+                return None
+            aggregate = 'argmax' if aggregate == 'max' else 'argmin'
+
+        column = None
+        if aggregate == 'distinct':
+            ordered = sorted(spans, key=lambda item: item[1])
+            candidates = [h for h, span in ordered if span[0] > distinct.start() and h not in filtered]
+            if group_by or not candidates:
+                return None
+            column = candidates[0]
+        elif aggregate != 'count':
+            candidates = [h for h in self.mentions(text) if h in self.numeric and h != group_by and h not in filtered]
+            if not candidates:
+                return None
+            column = candidates[0]
+        return QueryPlan(aggregate, column, group_by, filters)
+
+    @staticmethod
+    def unparsed(text, consumed):
+        """True if the question has a number, a word that is not a column, value or question
+        word, or a qualifier whose words were not parsed"""
+        chars = list(text)
+        for start, end in consumed:
+            chars[start:end] = '#' * (end - start)
+        words = re.findall(r"#+|[a-z0-9][\w'.-]*", "".join(chars))
+        for i, word in enumerate(words):
+            if any(c.isdigit() for c in word):
+                return True
+            if not word.startswith('#') and word not in QUALIFIER_WORDS | FILLER_WORDS | QUESTION_WORDS:
+                return True
+            if word in QUALIFIER_WORDS:
+                following = next((w for w in words[i + 1:] if w not in FILLER_WORDS), '#')
+                if not following.startswith('#'):
+                    return True
+        return False
+
+    def numeric_filters(self, text, consumed):
+        """Comparisons written right after a numeric column, e.g. 'price over 100'"""
+        filters = []
+        for pattern, header in self.patterns:
+            if header not in self.numeric:
+                continue
+            for match in pattern.finditer(text):
+                rest = text[match.end():]
+                for op, words in COMPARISONS:
+                    comparison = re.match(
+                        r"\s*(?:is\s+)?(?:" + "|".join(map(re.escape, words)) + r")\s*(-?\d+(?:\.\d+)?)", rest
+                    )
+                    if comparison:
+                        filters.append((header, op, float(comparison.group(1))))
+                        consumed.append((match.start(), match.end() + comparison.end()))
+                        break
+        return filters
+
+    def category_filters(self, text, group_by, consumed):
+        """Equality filters for text-column values named in the question, longest values first"""
+        named = []
+        for header in self.data.headers:
+            if header in self.numeric or header == group_by:
+                continue
+            values = self.category_values(header)
+            if values is not None:
+                named += [(value, header) for value in values if len(value) >= 2]
+
+        filters = []
+        taken = []
+        for value, header in sorted(named, key=lambda item: -len(item[0])):
+            for match in re.finditer(r"\b" + re.escape(value.lower()) + r"(?:e?s)?\b", text):
+                # "york" is not a second filter when "new york" was already found, and the
+                # value "Total" is not a filter in "the total price"
+                if any(s < match.end() and match.start() < e for s, e in taken + consumed):
+                    continue
+                filters.append((header, '==', value))
+                taken.append(match.span())
+                break
+        consumed += taken
+        return filters
+
+    def category_values(self, header):
+        table = self.data.table
+        if table is None:
+            # Streaming mode keeps no dictionary; only values seen in the preview are recognised
+            idx = self.data.headers.index(header)
+            return sorted({row[idx] for row in self.data.preview if idx < len(row)})
+        column = table.column(header)
+        if column is None or len(column.categories) > MAX_FILTER_CATEGORIES:
+            return None
+        return column.categories.tolist()
+
+    def filter_mask(self, plan):
+        mask = np.ones(self.data.row_count, dtype=bool)
+        for column, op, value in plan.filters:
+            values = self.data.get_array(column)
+            if op == '==':
+                mask &= values == value
+            elif op == 'in':
+                mask &= np.isin(values, value)
+            else:
+                with np.errstate(invalid='ignore'):
+                    mask &= {'>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal}[op](values, value)
+        return mask
+
+    def extreme_rows(self, plan):
+        """(row numbers, rows, matched) of the rows holding the max or min of plan.column"""
+        mask = self.filter_mask(plan)
+        values = self.data.get_array(plan.column).astype(np.float64)
+        candidates = mask & ~np.isnan(values)
+        if not candidates.any():
+            return [], [], int(mask.sum())
+        best = values[candidates].max() if plan.aggregate == 'argmax' else values[candidates].min()
+        positions = np.flatnonzero(candidates & (values == best))[:MAX_ROWS].tolist()
+        return positions, [self.data.get_rows(i, 1)[0] for i in positions], int(mask.sum())
+
+    def execute(self, plan):
+        """Evaluate a plan with NumPy over every row; returns (group labels, values, row count)"""
+        mask = self.filter_mask(plan)
+        matched = int(mask.sum())
+
+        if plan.aggregate == 'distinct':
+            values = self.data.get_array(plan.column)[mask]
+            if plan.column in self.numeric:
+                values = values.astype(np.float64)
+                values = values[~np.isnan(values)]
+            else:
+                values = values[values != '']
+            return ['all rows'], [float(len(np.unique(values)))], matched
+
+        values = None
+        if plan.column:
+            values = self.data.get_array(plan.column).astype(np.float64)[mask]
+            present = ~np.isnan(values)
+        else:
+            present = np.ones(matched, dtype=bool)
+
+        if plan.group_by is None:
+            return ['all rows'], [self.aggregate(plan.aggregate, values, present)], matched
+
+        labels, groups = np.unique(self.data.get_array(plan.group_by)[mask].astype(str), return_inverse=True)
+        results = []
+        if plan.aggregate in ('count', 'sum', 'mean'):
+            counts = np.bincount(groups[present], minlength=len(labels)).astype(np.float64)
+            if plan.aggregate == 'count':
+                results = counts
+            else:
+                sums = np.bincount(groups[present], weights=values[present], minlength=len(labels))
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    results = sums if plan.aggregate == 'sum' else sums / counts
+        else:
+            order = np.argsort(groups, kind='stable')
+            sorted_groups = groups[order]
+            bounds = np.searchsorted(sorted_groups, np.arange(len(labels) + 1))
+            sorted_values, sorted_present = values[order], present[order]
+            for g in range(len(labels)):
+                chunk = slice(bounds[g], bounds[g + 1])
+                results.append(self.aggregate(plan.aggregate, sorted_values[chunk], sorted_present[chunk]))
+            results = np.array(results, dtype=np.float64)
+
+        # Keep the answer small: the largest groups by value
+        top = np.argsort(-np.nan_to_num(results, nan=-np.inf))[:MAX_GROUPS]
+        return labels[top].tolist(), results[top].tolist(), matched
+
+    @staticmethod
+    def aggregate(name, values, present):
+        if name == 'count':
+            return float(present.sum())
+        numbers = values[present]
+        if not len(numbers):
+            return float('nan')
+        return float({
+            'mean': np.mean, 'median': np.median, 'sum': np.sum, 'max': np.max, 'min': np.min
+        }[name](numbers))
+
+    @staticmethod
+    def format_value(value):
+        if value != value:
+            return "no data"
+        return f"{int(value):,}" if float(value).is_integer() else f"{value:,.4f}".rstrip('0')
+
+    def answer(self, question):
+        """Computed result as short text for the LLM to phrase, or None if not an aggregate question"""
+        plan = self.plan(question)
+        if plan is None:
+            return None
+        lines = [f"Computed exactly over all {self.data.row_count} rows: {plan.describe()}"]
+        if plan.aggregate in ('argmax', 'argmin'):
+            positions, rows, matched = self.extreme_rows(plan)
+            lines.append(f"Rows matching filters: {matched}")
+            lines += [f"  Row {i + 1}: {json.dumps(dict(zip(self.data.headers, row)))}" for i, row in zip(positions, rows)]
+            if not rows:
+                lines.append("  no data")
+            return "\n".join(lines)
+
+        labels, values, matched = self.execute(plan)
+        lines.append(f"Rows matching filters: {matched}")
+        lines += [f"  {label}: {self.format_value(value)}" for label, value in zip(labels, values)]
+        return "\n".join(lines)
@@ -0,0 +1,116 @@
+from Imports import *
+
+class ResponseCache:
+    """Persistent cache of model responses and query embeddings
+
+    Responses are keyed by (model, dataset fingerprint, normalized question,
+    retrieved chunk ids). Entries expire after ttl seconds and are evicted
+    least-recently-used past max_entries.
+    """
+    def __init__(self, cache_dir=None, ttl=7 * 24 * 3600, max_entries=1000, name="responses"):
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.expanduser("~"), ".cache", "document-summarizer", "responses"
+        )
+        self.path = os.path.join(self.cache_dir, f"{name}.json")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.responses = {}  # key -> [response, created, last_used]
+        self.queries = {}  # key -> [base64 float32 vector, created, last_used]
+        self.counters = {'response_hits': 0, 'response_misses': 0, 'query_hits': 0, 'query_misses': 0}
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def normalize_question(question):
+        return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+    @staticmethod
+    def chunk_id(chunk):
+        return hashlib.sha1(chunk.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def key(cls, model, fingerprint, question, chunk_ids=()):
+        payload = json.dumps([model, fingerprint, cls.normalize_question(question), list(chunk_ids)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            self.responses = stored.get('responses', {})
+            self.queries = stored.get('queries', {})
+        except Exception as e:
+            print(f"Error loading response cache {self.path}: {e}")
+            self.responses = {}
+            self.queries = {}
+
+    def lookup(self, entries, key, counter):
+        now = time.time()
+        with self.lock:
+            entry = entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del entries[key]
+                entry = None
+            self.counters[counter + ('_hits' if entry else '_misses')] += 1
+            if entry is None:
+                return None
+            entry[2] = now
+            return entry[0]
+
+    def store(self, entries, key, value):
+        now = time.time()
+        with self.lock:
+            entries[key] = [value, now, now]
+
+    def get(self, key):
+        """Cached response for key, or None if missing or expired"""
+        return self.lookup(self.responses, key, 'response')
+
+    def put(self, key, response):
+        self.store(self.responses, key, response)
+
+    def get_query_embedding(self, model, query):
+        encoded = self.lookup(self.queries, self.key(model, None, query), 'query')
+        if encoded is None:
+            return None
+        return np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+
+    def put_query_embedding(self, model, query, vector):
+        encoded = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+        self.store(self.queries, self.key(model, None, query), encoded)
+
+    def save(self):
+        """Drop expired and over-limit entries and write the cache to disk"""
+        with self.lock:
+            for entries in (self.responses, self.queries):
+                self.evict(entries)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'responses': self.responses, 'queries': self.queries}, f)
+            os.replace(tmp_path, self.path)
+
+    def evict(self, entries):
+        now = time.time()
+        for key in [k for k, entry in entries.items() if now - entry[1] > self.ttl]:
+            del entries[key]
+        if self.max_entries is not None and len(entries) > self.max_entries:
+            keep = sorted(entries.items(), key=lambda item: item[1][2], reverse=True)[:self.max_entries]
+            entries.clear()
+            entries.update(keep)
+
+    def clear(self):
+        with self.lock:
+            self.responses = {}
+            self.queries = {}
+
+    def stats(self):
+        """Hit/miss counts and hit rates since the cache was opened"""
+        stats = dict(self.counters)
+        for kind in ('response', 'query'):
+            lookups = stats[f'{kind}_hits'] + stats[f'{kind}_misses']
+            stats[f'{kind}_hit_rate'] = stats[f'{kind}_hits'] / lookups if lookups else 0.0
+        stats['entries'] = len(self.responses)
+        return stats
@@ -0,0 +1,102 @@
+from Imports import *
+
+QUOTE = ord('"')
+NEWLINE = ord('\n')
+
+
+class RowIndex:
+    """Byte offsets of every stride-th CSV record, so any row can be read with one seek
+
+    Built in one vectorized pass over the raw bytes: a newline ends a record only
+    when the number of quotes before it is even, so quoted newlines are handled.
+    """
+    def __init__(self, filepath, stride=64, block_size=1 << 22):
+        self.filepath = filepath
+        self.stride = stride
+        self.block_size = block_size
+        self.offsets = np.zeros(0, dtype=np.int64)  # start of data rows 0, stride, 2*stride, ...
+        self.complete_rows = 0
+        self.size = 0  # bytes indexed, up to the start of any unterminated last record
+        self.partial = False  # file ends in a record without a trailing newline
+
+    def __len__(self):
+        return self.complete_rows + (1 if self.partial else 0)
+
+    def build(self, progress_callback=None):
+        """Index the whole file; returns self"""
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.complete_rows = 0
+        self.size = 0
+        self.scan(progress_callback)
+        return self
+
+    def extend(self, progress_callback=None):
+        """Index rows appended since the last build or extend; returns the number of new rows"""
+        before = len(self)
+        self.scan(progress_callback)
+        return len(self) - before
+
+    def scan(self, progress_callback=None):
+        header = self.size == 0  # the first record is the header row
+        # Drop the offset of an unterminated last record; it is found again below
+        offsets = [self.offsets[:(self.complete_rows + self.stride - 1) // self.stride]]
+        record_start = self.size
+        in_quotes = 0
+        with open(self.filepath, 'rb') as f:
+            total = os.fstat(f.fileno()).st_size
+            f.seek(self.size)
+            position = self.size
+            while True:
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                data = np.frombuffer(block, dtype=np.uint8)
+                # Quote parity before each byte; uint8 wraps but keeps the parity
+                parity = (np.cumsum(data == QUOTE, dtype=np.uint8) + in_quotes) & 1
+                newlines = np.flatnonzero(data == NEWLINE)
+                ends = newlines[parity[newlines] == 0] + position
+                if len(ends):
+                    starts = np.concatenate(([record_start], ends[:-1] + 1))
+                    record_start = int(ends[-1]) + 1
+                    if header:
+                        starts = starts[1:]
+                        header = False
+                    rows = np.arange(self.complete_rows, self.complete_rows + len(starts))
+                    offsets.append(starts[rows % self.stride == 0])
+                    self.complete_rows += len(starts)
+                in_quotes = int(parity[-1])
+                position += len(block)
+                if progress_callback:
+                    progress_callback(position, total)
+
+        self.size = record_start
+        self.partial = position > record_start and not header
+        if self.partial and self.complete_rows % self.stride == 0:
+            offsets.append(np.array([record_start], dtype=np.int64))
+        self.offsets = np.concatenate(offsets).astype(np.int64)
+        return self
+
+    def snapshot(self):
+        meta = {'stride': self.stride, 'complete_rows': self.complete_rows, 'size': self.size, 'partial': self.partial}
+        return meta, {'offsets': self.offsets}
+
+    @classmethod
+    def from_snapshot(cls, filepath, meta, arrays):
+        index = cls(filepath, meta['stride'])
+        index.offsets = arrays['offsets']
+        index.complete_rows = meta['complete_rows']
+        index.size = meta['size']
+        index.partial = meta['partial']
+        return index
+
+    def read(self, start, count):
+        """Parsed rows start to start+count, reading at most stride-1 rows before start"""
+        start = max(0, start)
+        if start >= len(self) or count <= 0:
+            return []
+        block = start // self.stride
+        with open(self.filepath, 'rb') as raw:
+            raw.seek(int(self.offsets[block]))
+            f = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            skip = start - block * self.stride
+            return list(itertools.islice(csv.reader(f), skip, skip + count))
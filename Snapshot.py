@@ -0,0 +1,131 @@
+from Imports import *
+
+MAGIC = b"DSSNAP01"
+ALIGN = 64  # array offsets are aligned so mapped arrays are well aligned for NumPy
+
+
+def aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def snapshot_files(path):
+    """path and the numbered copies written while it was mapped (path.1, path.2, ...), newest first"""
+    directory, name = os.path.split(os.path.abspath(path))
+    numbered = re.compile(re.escape(name) + r"\.\d+$")
+    try:
+        names = [name] + [f for f in os.listdir(directory) if numbered.match(f)]
+    except OSError:
+        return []
+    files = [os.path.join(directory, f) for f in names if os.path.isfile(os.path.join(directory, f))]
+    return sorted(files, key=lambda f: os.stat(f).st_mtime_ns, reverse=True)
+
+
+def next_free_name(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    numbers = [int(f.rsplit('.', 1)[1]) for f in map(os.path.basename, snapshot_files(path)) if f != name]
+    return f"{path}.{max(numbers, default=0) + 1}"
+
+
+def write_snapshot(path, meta, arrays):
+    """Write meta (JSON) and named NumPy arrays into one file, replacing it atomically
+
+    Layout: magic, header length, JSON header, then each array's raw bytes at an
+    aligned offset recorded in the header, so read_snapshot can map them in place.
+    Returns the file written: path, or a numbered copy if path could not be replaced.
+    """
+    layout = {}
+    offset = 0
+    contiguous = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise TypeError(f"Snapshot array {name!r} holds Python objects; use put_strings")
+        contiguous[name] = array
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = aligned(offset + array.nbytes)
+    header = json.dumps({'meta': meta, 'arrays': layout}).encode('utf-8')
+    data_start = aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for name, array in contiguous.items():
+                if array.nbytes:
+                    f.seek(data_start + layout[name]['offset'])
+                    f.write(memoryview(array).cast('B'))
+            f.truncate(data_start + offset)
+        try:
+            # On POSIX, readers that mapped the old file keep their pages; the new one takes its name
+            written = path
+            os.replace(tmp_path, written)
+        except PermissionError:
+            # Windows cannot replace a file that is still mapped; read_snapshot takes the newest copy
+            written = next_free_name(path)
+            os.replace(tmp_path, written)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Older copies go once nothing maps them; removing one that is still mapped fails harmlessly
+    for old in snapshot_files(path):
+        if old != os.path.abspath(written):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return written
+
+
+def read_snapshot(path):
+    """(meta, arrays) from write_snapshot; arrays are read-only views of the mapped file
+
+    Reads the newest of path and the numbered copies write_snapshot falls back to.
+    """
+    files = snapshot_files(path)
+    if not files:
+        raise FileNotFoundError(path)
+    path = files[0]
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = aligned(len(MAGIC) + 8 + length)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        if not count:
+            arrays[name] = np.empty(spec['shape'], dtype=dtype)
+            continue
+        array = np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + spec['offset'])
+        arrays[name] = array.reshape(spec['shape'])
+    return header['meta'], arrays
+
+
+def put_strings(arrays, name, strings):
+    """Store strings as one UTF-8 blob plus character offsets"""
+    strings = [str(s) for s in strings]
+    arrays[f"{name}.text"] = np.frombuffer("".join(strings).encode('utf-8'), dtype=np.uint8)
+    arrays[f"{name}.offsets"] = np.cumsum([0] + [len(s) for s in strings], dtype=np.int64)
+
+
+def get_strings(arrays, name):
+    """Strings stored by put_strings, as a list"""
+    text = arrays[f"{name}.text"].tobytes().decode('utf-8')
+    offsets = arrays[f"{name}.offsets"].tolist()
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def prefixed(prefix, arrays):
+    return {f"{prefix}.{name}": array for name, array in arrays.items()}
+
+
+def unprefixed(prefix, arrays):
+    start = len(prefix) + 1
+    return {name[start:]: array for name, array in arrays.items() if name.startswith(prefix + ".")}
@@ -1,23 +1,44 @@
 from Imports import *
-from CSVParser import CSVParser
-from OllamaServer import OllamaServer
+from Engine import Engine
+from OllamaServer import OllamaServerPool
+from OllamaClient import OllamaClient
+from ConversationContext import ConversationContext
+from Metrics import metrics
+from JobScheduler import JobScheduler, JobCancelled, INTERACTIVE, SUMMARY, BACKGROUND
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
 class Summarizer:
+    STREAM_UPDATE_INTERVAL = 0.05  # seconds between chat display refreshes while streaming
+    WHEEL_ROWS = 3  # preview rows scrolled per mouse wheel step
+    
     def __init__(self):
         self.root = ctk.CTk()
         self.root.title("Document Summarizer")
         self.root.geometry("1000x800")
-        self.server = OllamaServer()
-        self.conversation = []
-        self.current_model = 'gemma3:1b'
-        self.embedding_model = 'nomic-embed-text' 
+        self.context = ConversationContext()
+        self.engine = Engine()
+        self.server = OllamaServerPool(
+            models=[self.engine.model], embedding_models=[self.engine.embedding_model]
+        )
         self.csv_data = None
         self.csv_filename = None
         self.csv_summary = None
+        self.csv_profile = None
         self.embeddings_ready = False
+        self.restore_job = None
+        self.after_restore = None  # index action clicked while cached embeddings were being restored
+        self.loading = False
+        self.preview_start = 0
+        self.preview_page_rows = 20
+        # One streamed answer at a time in the chat display
+        self.stream_lock = threading.Lock()
+        # One question turn at a time reads and extends the conversation context
+        self.turn_lock = threading.Lock()
+        self.scheduler = JobScheduler()
+        self.scheduler.add_listener(lambda jobs: self.root.after(0, lambda: self.show_jobs(jobs)))
+        metrics.enable_from_env()
         
         self.setup_ui()
         self.start_server()
@@ -32,7 +53,7 @@ class Summarizer:
         # Model selector
         ctk.CTkLabel(control_frame, text="Model:").pack(side="left", padx=10)
         
-        self.model_var = ctk.StringVar(value=self.current_model)
+        self.model_var = ctk.StringVar(value=self.engine.model)
         model_menu = ctk.CTkOptionMenu(
             control_frame,
             values=['gemma3:1b', 'gemma2:2b', 'llama3.2', 'phi3', 'mistral', 'qwen2.5'],
@@ -60,6 +81,15 @@ class Summarizer:
             hover_color="#d35400"
         ).pack(side="left", padx=5)
         
+        ctk.CTkButton(
+            control_frame,
+            text="Refresh",
+            command=self.refresh_data,
+            width=100,
+            fg_color="#16a085",
+            hover_color="#138d75"
+        ).pack(side="left", padx=5)
+        
         ctk.CTkButton(
             control_frame,
             text="Summarize",
@@ -69,6 +99,23 @@ class Summarizer:
             hover_color="#8e44ad"
         ).pack(side="left", padx=5)
         
+        self.summary_mode_var = ctk.StringVar(value="Quick")
+        ctk.CTkOptionMenu(
+            control_frame,
+            values=["Quick", "Full"],
+            variable=self.summary_mode_var,
+            width=80
+        ).pack(side="left", padx=5)
+        
+        self.cache_var = ctk.BooleanVar(value=self.engine.use_cache)
+        ctk.CTkCheckBox(
+            control_frame,
+            text="Cache",
+            variable=self.cache_var,
+            command=self.toggle_cache,
+            width=80
+        ).pack(side="left", padx=5)
+        
         ctk.CTkButton(
             control_frame,
             text="Clear",
@@ -78,6 +125,15 @@ class Summarizer:
             width=100
         ).pack(side="left", padx=5)
         
+        ctk.CTkButton(
+            control_frame,
+            text="Stop",
+            command=self.stop_jobs,
+            fg_color="gray",
+            hover_color="#555555",
+            width=80
+        ).pack(side="left", padx=5)
+        
         # Status
         self.status_label = ctk.CTkLabel(
             control_frame,
@@ -86,6 +142,14 @@ class Summarizer:
         )
         self.status_label.pack(side="right", padx=10)
         
+        # Running, paused and queued jobs
+        self.jobs_label = ctk.CTkLabel(
+            control_frame,
+            text="",
+            text_color="gray"
+        )
+        self.jobs_label.pack(side="right", padx=5)
+        
         # Main content area
         content_frame = ctk.CTkFrame(self.root)
         content_frame.pack(fill="both", expand=True, padx=20, pady=(0, 10))
@@ -100,12 +164,32 @@ class Summarizer:
             font=("Arial", 14, "bold")
         ).pack(pady=5)
         
+        self.preview_info = ctk.CTkLabel(left_frame, text="", anchor="w", justify="left")
+        self.preview_info.pack(fill="x", padx=5)
+        self.preview_info.bind('<Configure>', lambda e: self.preview_info.configure(wraplength=e.width))
+        
+        self.load_progress = ctk.CTkProgressBar(left_frame)
+        self.load_progress.set(0)
+        
+        # Only the visible page of rows is read and formatted; the scrollbar spans every row
+        preview_frame = ctk.CTkFrame(left_frame, fg_color="transparent")
+        preview_frame.pack(fill="both", expand=True, padx=5, pady=5)
+        
+        self.preview_scrollbar = ctk.CTkScrollbar(preview_frame, command=self.scroll_preview)
+        self.preview_scrollbar.pack(side="right", fill="y")
+        
         self.csv_preview = ctk.CTkTextbox(
-            left_frame,
+            preview_frame,
             font=("Courier", 10),
             wrap="none"
         )
-        self.csv_preview.pack(fill="both", expand=True, padx=5, pady=5)
+        self.csv_preview.pack(side="left", fill="both", expand=True)
+        self.csv_preview.bind('<Configure>', self.resize_preview)
+        self.csv_preview.bind('<MouseWheel>', self.on_preview_wheel)
+        self.csv_preview.bind('<Button-4>', self.on_preview_wheel)
+        self.csv_preview.bind('<Button-5>', self.on_preview_wheel)
+        self.csv_preview.bind('<Prior>', lambda e: self.scroll_preview('scroll', -1, 'pages') or "break")
+        self.csv_preview.bind('<Next>', lambda e: self.scroll_preview('scroll', 1, 'pages') or "break")
         
         # Right side - Analysis
         right_frame = ctk.CTkFrame(content_frame)
@@ -135,6 +219,8 @@ class Summarizer:
         )
         self.input_text.pack(side="left", fill="both", expand=True, padx=(0, 10))
         self.input_text.bind('<Return>', self.on_enter)
+        self.root.bind('<Control-p>', self.profile_next_question)
+        self.root.bind('<Escape>', self.stop_jobs)
         
         self.send_button = ctk.CTkButton(
             input_frame,
@@ -160,12 +246,140 @@ class Summarizer:
     def update_status(self, message):
         self.status_label.configure(text=message)
     
+    def show_jobs(self, jobs):
+        icons = {'running': "▶", 'paused': "⏸"}
+        active = [f"{icons[job.status]} {job.name}" for job in jobs if job.status in icons]
+        queued = sum(1 for job in jobs if job.status == 'queued')
+        if queued:
+            active.append(f"{queued} queued")
+        self.jobs_label.configure(text=" · ".join(active))
+    
+    def schedule(self, name, fn, priority, key, on_finished=None):
+        """Submit a job, telling the user when the same work is already queued or running
+
+        on_finished(job) runs on the Tk thread however the job ends, including when it
+        is cancelled before it starts.
+        """
+        def finished(job):
+            def update():
+                if job.status == 'cancelled':
+                    self.update_status("✓ Stopped")
+                if on_finished is not None:
+                    on_finished(job)
+            self.root.after(0, update)
+        
+        job = self.scheduler.submit(name, fn, priority=priority, key=key, on_finished=finished)
+        if job.fn is not fn:
+            self.add_message("System", f"{job.name} is already {job.status}", "system")
+        return job
+    
+    def wait_for_restore(self, action):
+        """True if cached embeddings are still being restored; action is run again once they are"""
+        job = self.restore_job
+        if job is None or job.finished.is_set():
+            return False
+        self.after_restore = action
+        self.add_message("System", "Waiting for cached embeddings to be restored first...", "system")
+        return True
+    
+    def restore_finished(self, job):
+        if job is not self.restore_job:
+            return  # restore of a file that is no longer loaded
+        action, self.after_restore = self.after_restore, None
+        if action is not None and job.status != 'cancelled':
+            action()
+    
+    def stop_jobs(self, event=None):
+        """Cancel every queued and running job; running ones stop at their next request"""
+        if self.scheduler.jobs():
+            self.scheduler.cancel_all()
+            self.update_status("Stopping...")
+    
     def add_message(self, sender, message, msg_type="user"):
         prefix = "📤 " if msg_type == "user" else "🤖 " if msg_type == "bot" else "ℹ️ "
         self.chat_display.insert("end", f"{prefix}{sender}: {message}\n\n")
         self.chat_display.see("end")
     
+    def begin_stream_message(self, sender):
+        self.chat_display.insert("end", f"🤖 {sender}: ")
+        self.chat_display.see("end")
+    
+    def append_stream_text(self, text):
+        self.chat_display.insert("end", text)
+        self.chat_display.see("end")
+    
+    @metrics.timed('llm.stream')
+    def stream_chat(self, messages, options=None, job=None):
+        """Stream a chat response into the display from a worker thread; returns the full answer
+
+        Raises JobCancelled, after closing the request, if job is cancelled mid-answer.
+        """
+        self.root.after(0, lambda: self.begin_stream_message("Bot"))
+        
+        start = time.perf_counter()
+        first_token = None
+        last_flush = start
+        pending = []
+        parts = []
+        eval_count = eval_duration = None
+        
+        stream = OllamaClient.shared().chat(self.engine.model, messages, options=options, stream=True)
+        for chunk in stream:
+            if job is not None and job.cancelled:
+                # Closing the stream drops the connection, which stops generation on the server
+                stream.close()
+                batch = "".join(pending) + " [stopped]\n\n"
+                self.root.after(0, lambda: self.append_stream_text(batch))
+                raise JobCancelled(job.name)
+            
+            text = chunk['message']['content']
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    self.root.after(0, lambda: self.update_status("Generating..."))
+                pending.append(text)
+                parts.append(text)
+            
+            # Throttle UI updates so the Tk loop is not flooded with one call per token
+            now = time.perf_counter()
+            if pending and now - last_flush >= self.STREAM_UPDATE_INTERVAL:
+                batch = "".join(pending)
+                self.root.after(0, lambda batch=batch: self.append_stream_text(batch))
+                pending = []
+                last_flush = now
+            
+            if chunk.get('done'):
+                eval_count = chunk.get('eval_count')
+                eval_duration = chunk.get('eval_duration')
+                self.engine.count_tokens(chunk)
+        
+        end = time.perf_counter()
+        metrics.observe('llm.prefill.seconds', (first_token or end) - start)
+        metrics.observe('llm.generate.seconds', end - (first_token or end))
+        batch = "".join(pending) + "\n\n"
+        self.root.after(0, lambda: self.append_stream_text(batch))
+        
+        # Prefer the server's own generation timings; fall back to wall clock per streamed chunk
+        ttft = (first_token or end) - start
+        if eval_count and eval_duration:
+            tokens_per_sec = eval_count / (eval_duration / 1e9)
+        else:
+            tokens_per_sec = len(parts) / max(end - (first_token or start), 1e-9)
+        self.root.after(0, lambda: self.update_status(
+            f"✓ Ready · first token {ttft:.1f}s · {tokens_per_sec:.1f} tok/s"))
+        
+        return "".join(parts)
+    
+    def show_cached_answer(self, answer):
+        """Display a cached answer from a worker thread, with the cache hit rate"""
+        hit_rate = self.engine.response_cache.stats()['response_hit_rate']
+        self.root.after(0, lambda: self.add_message("Bot", answer, "bot"))
+        self.root.after(0, lambda: self.update_status(f"✓ Cached answer · hit rate {hit_rate:.0%}"))
+    
     def load_csv(self):
+        if self.loading:
+            return
+        
         file_path = filedialog.askopenfilename(
             title="Select CSV File",
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
@@ -174,103 +388,243 @@ class Summarizer:
         if not file_path:
             return
         
-        try:
-            self.csv_data = CSVParser(file_path)
-            self.csv_filename = os.path.basename(file_path)
-            self.embeddings_ready = False
-            
-            # Display preview
-            self.csv_preview.delete("1.0", "end")
-            
-            info_text = f"File: {self.csv_filename}\n"
-            info_text += f"Rows: {len(self.csv_data.rows)}\n"
-            info_text += f"Columns: {len(self.csv_data.headers)}\n"
-            info_text += f"\nColumns: {', '.join(self.csv_data.headers)}\n"
-            info_text += "\n" + "="*80 + "\n\n"
-            info_text += self.csv_data.get_preview(20)
-            
-            if len(self.csv_data.rows) > 20:
-                info_text += f"\n\n... and {len(self.csv_data.rows) - 20} more rows"
-            
-            self.csv_preview.insert("1.0", info_text)
-            
-            self.add_message("System", 
-                f"✓ Loaded {self.csv_filename} ({len(self.csv_data.rows)} rows, {len(self.csv_data.headers)} columns)", 
-                "system")
-            
-            self.add_message("System", 
-                "Click 'Generate Embeddings' to enable intelligent querying of all data", 
-                "system")
-            
-            self.generate_basic_summary()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load CSV: {str(e)}")
-            self.add_message("System", f"✗ Error: {str(e)}", "system")
+        filename = os.path.basename(file_path)
+        self.loading = True
+        self.load_progress.set(0)
+        self.load_progress.pack(fill="x", padx=5, pady=(0, 5), after=self.preview_info)
+        
+        def report(stage):
+            def progress(done, total):
+                fraction = done / total if total else 1.0
+                self.root.after(0, lambda: self.show_load_progress(f"{stage} {filename}", fraction))
+            return progress
+        
+        # Parsing, row indexing and profiling run here so the window keeps responding
+        def load():
+            try:
+                data = self.engine.load(file_path, progress_callback=report("Loading"))
+                if data.stream:
+                    data.build_row_index(report("Indexing"))
+            except Exception as e:
+                self.root.after(0, lambda: self.load_failed(e))
+                return
+            self.root.after(0, lambda: self.update_status(f"Profiling {filename}..."))
+            summary = self.compute_basic_summary(data, filename)
+            self.root.after(0, lambda: self.load_finished(data, filename, summary))
+        
+        threading.Thread(target=load, daemon=True).start()
+    
+    def show_load_progress(self, message, fraction):
+        self.load_progress.set(fraction)
+        self.update_status(f"{message}... {fraction:.0%}")
+    
+    def load_finished(self, data, filename, summary):
+        self.loading = False
+        self.load_progress.pack_forget()
+        self.csv_data = data
+        self.csv_filename = filename
+        self.embeddings_ready = False
+        self.preview_start = 0
+        # Questions about the previous file must not leak into prompts or cache keys
+        self.context.clear()
+        self.csv_summary = self.csv_profile = None
+        self.after_restore = None
+        self.show_preview()
+        self.update_status("✓ Ready")
+        
+        source = " from its session snapshot" if data.restored else ""
+        self.add_message("System", 
+            f"✓ Loaded {self.csv_filename}{source} ({self.csv_data.row_count} rows, {len(self.csv_data.headers)} columns)", 
+            "system")
+        
+        self.add_message("System", 
+            "Click 'Generate Embeddings' to enable intelligent querying of all data", 
+            "system")
+        
+        self.set_basic_summary(summary)
+        self.load_cached_embeddings()
+    
+    def load_failed(self, error):
+        self.loading = False
+        self.load_progress.pack_forget()
+        self.update_status("✗ Error")
+        messagebox.showerror("Error", f"Failed to load CSV: {str(error)}")
+        self.add_message("System", f"✗ Error: {str(error)}", "system")
+    
+    def show_preview(self):
+        """Render only the rows visible from preview_start"""
+        if self.csv_data is None:
+            return
+        
+        total = self.csv_data.row_count
+        self.preview_start = max(0, min(self.preview_start, total - self.preview_page_rows))
+        rows = self.csv_data.get_rows(self.preview_start, self.preview_page_rows)
+        
+        self.preview_info.configure(text=(
+            f"File: {self.csv_filename} · Rows: {total:,} · Columns: {len(self.csv_data.headers)}"
+            f" · Showing {self.preview_start + 1:,}-{self.preview_start + len(rows):,}"
+            f"\nColumns: {', '.join(self.csv_data.headers)}"
+        ))
+        
+        header_line = self.csv_data.format_row(self.csv_data.headers)
+        lines = [header_line, "-" * len(header_line)]
+        lines += [self.csv_data.format_row(row) for row in rows]
+        self.csv_preview.delete("1.0", "end")
+        self.csv_preview.insert("1.0", "\n".join(lines))
+        
+        if total:
+            self.preview_scrollbar.set(self.preview_start / total, (self.preview_start + len(rows)) / total)
+        else:
+            self.preview_scrollbar.set(0, 1)
+    
+    def scroll_preview(self, action, amount, unit=None):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if self.csv_data is None:
+            return
+        
+        if action == 'moveto':
+            start = int(float(amount) * self.csv_data.row_count)
+        else:
+            step = self.preview_page_rows if unit == 'pages' else 1
+            start = self.preview_start + int(amount) * step
+        if start != self.preview_start:
+            self.preview_start = start
+            self.show_preview()
+    
+    def on_preview_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_preview('scroll', -self.WHEEL_ROWS)
+        else:
+            self.scroll_preview('scroll', self.WHEEL_ROWS)
+        return "break"
+    
+    def resize_preview(self, event):
+        """Fit the page to the textbox height (two lines go to the header)"""
+        line_height = max(1, tkfont.Font(font=("Courier", 10)).metrics('linespace'))
+        page_rows = max(1, event.height // line_height - 2)
+        if page_rows != self.preview_page_rows:
+            self.preview_page_rows = page_rows
+            self.show_preview()
+    
+    def refresh_data(self):
+        """Pick up rows added to the loaded file, re-embedding only new or changed chunks"""
+        if self.csv_data is None:
+            messagebox.showwarning("No Data", "Please upload a CSV file first!")
+            return
+        if self.wait_for_restore(self.refresh_data):
+            return
+        
+        csv_data = self.csv_data
+        filename = self.csv_filename
+        
+        def refresh(job):
+            self.root.after(0, lambda: self.update_status("Refreshing..."))
+            try:
+                rows_before = csv_data.row_count
+                rebuilt = self.engine.refresh(csv_data)
+                if csv_data.stream:
+                    csv_data.build_row_index()
+                if rebuilt or csv_data.row_count != rows_before:
+                    self.engine.save_snapshot(csv_data)
+                summary = self.compute_basic_summary(csv_data, filename)
+                
+                def done():
+                    if self.csv_data is not csv_data:
+                        return  # another file was opened meanwhile
+                    self.show_preview()
+                    self.set_basic_summary(summary)
+                    self.add_message("System", 
+                        f"✓ Refreshed: {self.csv_data.row_count - rows_before:+d} rows, "
+                        f"{rebuilt} chunks re-indexed", "system")
+                    self.update_status("✓ Ready")
+                
+                self.root.after(0, done)
+                
+            except Exception as e:
+                self.root.after(0, lambda: self.add_message("System", f"✗ Error: {str(e)}", "system"))
+                self.root.after(0, lambda: self.update_status("✗ Error"))
+        
+        self.schedule("Refresh", refresh, BACKGROUND, ('index', csv_data.filepath))
     
     def generate_embeddings(self):
         """Generate embeddings for CSV data"""
         if self.csv_data is None:
             messagebox.showwarning("No Data", "Please upload a CSV file first!")
             return
+        if self.wait_for_restore(self.generate_embeddings):
+            return
         
-        self.update_status("Generating embeddings...")
-        self.add_message("System", "Generating embeddings... This may take a moment.", "system")
+        csv_data = self.csv_data
         
-        def generate():
+        def generate(job):
+            self.root.after(0, lambda: self.update_status("Generating embeddings..."))
+            self.root.after(0, lambda: self.add_message("System", 
+                "Generating embeddings... This may take a moment.", "system"))
             try:
-                # Create chunks
-                num_chunks = self.csv_data.create_chunks(chunk_size=10)
-                self.root.after(0, lambda: self.add_message("System", 
-                    f"Created {num_chunks} chunks from {len(self.csv_data.rows)} rows", "system"))
+                def on_progress(done, total):
+                    self.root.after(0, lambda: self.update_status(f"Embedding {done}/{total} chunks..."))
                 
-                # Generate embeddings
-                num_embeddings = self.csv_data.generate_embeddings(self.embedding_model)
+                # Create chunks and generate embeddings
+                num_embeddings = self.engine.index(csv_data, progress_callback=on_progress, checkpoint=job.checkpoint)
+                self.engine.save_snapshot(csv_data)
                 
                 self.embeddings_ready = True
                 self.root.after(0, lambda: self.add_message("System", 
                     f"✓ Generated {num_embeddings} embeddings! You can now ask detailed questions.", "system"))
                 self.root.after(0, lambda: self.update_status("✓ Embeddings ready"))
                 
+            except JobCancelled:
+                self.root.after(0, lambda: self.add_message("System", 
+                    "Embedding stopped; finished batches are cached and will not be redone.", "system"))
+                raise
             except Exception as e:
                 self.root.after(0, lambda: self.add_message("System", f"✗ Error: {str(e)}", "system"))
                 self.root.after(0, lambda: self.update_status("✗ Error"))
         
-        threading.Thread(target=generate, daemon=True).start()
+        self.schedule("Embeddings", generate, BACKGROUND, ('index', csv_data.filepath))
     
-    def generate_basic_summary(self):
-        """Generate basic statistical summary"""
-        if self.csv_data is None:
-            return
+    def load_cached_embeddings(self):
+        """Restore embeddings from the snapshot or on-disk cache, then snapshot whatever had to be built"""
+        csv_data = self.csv_data
+        
+        def restore(job):
+            try:
+                before = (len(csv_data.chunks), len(csv_data.embeddings))
+                if self.engine.restore_index(csv_data) and csv_data is self.csv_data:
+                    self.embeddings_ready = True
+                    self.root.after(0, lambda: self.add_message("System", 
+                        f"✓ Restored {len(csv_data.embeddings)} cached embeddings", "system"))
+                    self.root.after(0, lambda: self.update_status("✓ Embeddings ready"))
+                # Snapshot what was parsed, chunked or found in the cache so the next open skips it
+                if not csv_data.restored or before != (len(csv_data.chunks), len(csv_data.embeddings)):
+                    self.engine.save_snapshot(csv_data)
+            except Exception as e:
+                print(f"Error restoring cached embeddings: {e}")
         
+        # Its own key, so "Generate Embeddings" is not reported as already running; index jobs
+        # clicked meanwhile wait for it through wait_for_restore
+        self.restore_job = self.scheduler.submit(
+            "Restore embeddings", restore, BACKGROUND, ('restore', csv_data.filepath),
+            on_finished=lambda job: self.root.after(0, lambda: self.restore_finished(job))
+        )
+    
+    def compute_basic_summary(self, data, filename):
+        """(summary, profile) from a worker thread; profiling a streamed file re-reads it"""
         try:
-            summary_parts = []
-            summary_parts.append(f"Dataset: {self.csv_filename}")
-            summary_parts.append(f"Total Records: {len(self.csv_data.rows)}")
-            summary_parts.append(f"Total Columns: {len(self.csv_data.headers)}")
-            
-            numeric_cols = self.csv_data.get_numeric_columns()
-            text_cols = [h for h in self.csv_data.headers if h not in numeric_cols]
-            
-            if numeric_cols:
-                summary_parts.append(f"\nNumeric Columns ({len(numeric_cols)}): {', '.join(numeric_cols)}")
-            if text_cols:
-                summary_parts.append(f"\nText Columns ({len(text_cols)}): {', '.join(text_cols)}")
-            
-            if numeric_cols:
-                summary_parts.append("\nNumeric Statistics:")
-                for col in numeric_cols[:5]:
-                    stats = self.csv_data.get_stats(col)
-                    if stats:
-                        summary_parts.append(
-                            f"  {col}: mean={stats['mean']:.2f}, "
-                            f"min={stats['min']:.2f}, max={stats['max']:.2f}"
-                        )
-            
-            self.csv_summary = "\n".join(summary_parts)
-            
+            return self.engine.basic_summary(data, filename)
         except Exception as e:
             print(f"Error generating summary: {e}")
+            return None
+    
+    def set_basic_summary(self, summary):
+        """Use a summary from compute_basic_summary for prompts (Tk thread)"""
+        if self.csv_data is None or summary is None:
+            return
+        
+        self.csv_summary, self.csv_profile = summary
+        self.context.set_dataset(
+            self.engine.dataset_preamble(self.csv_data, self.csv_filename, self.csv_summary)
+        )
     
     def auto_summarize(self):
         """Generate AI summary"""
@@ -278,58 +632,46 @@ class Summarizer:
             messagebox.showwarning("No Data", "Please upload a file first!")
             return
         
-        self.add_message("You", "Generate a comprehensive summary", "user")
-        self.send_button.configure(state="disabled")
-        self.update_status("Analyzing...")
+        mode = self.summary_mode_var.get()
+        csv_data = self.csv_data
         
-        def analyze():
+        # The send button stays enabled: questions outrank the summary and run first
+        @metrics.profiled('summary')
+        @metrics.timed('summary')
+        def analyze(job):
+            self.root.after(0, lambda: self.add_message("You", "Generate a comprehensive summary", "user"))
+            self.root.after(0, lambda: self.update_status("Analyzing..."))
             try:
-                # Use relevant chunks if embeddings are ready
-                if self.embeddings_ready:
-                    relevant_chunks = self.csv_data.find_relevant_chunks(
-                        "summary statistics overview", 
-                        self.embedding_model,
-                        top_k=5
+                if mode == "Full":
+                    # Map-reduce over every chunk; partial summaries are cached between runs
+                    def progress(level, done, total):
+                        stage = "Summarizing parts" if level == 0 else f"Merging summaries (level {level})"
+                        self.root.after(0, lambda: self.update_status(f"{stage} {done}/{total}"))
+                    
+                    prompt = self.engine.full_summary_prompt(
+                        csv_data, self.csv_filename, self.csv_summary,
+                        progress_callback=progress, checkpoint=job.checkpoint
                     )
-                    context = "\n\n".join(relevant_chunks)
                 else:
-                    # Fallback to sample data
-                    context = json.dumps(self.csv_data.to_dict()[:10], indent=2)
-                
-                prompt = f"""Analyze this document:
-
-                            Filename: {self.csv_filename}
-                            Total Rows: {len(self.csv_data.rows)}
-                            Columns: {', '.join(self.csv_data.headers)}
-
-                            {context}
-
-                            Statistics:
-                            {self.csv_summary}
-
-                            Provide:
-                            1. Dataset overview
-                            2. Key patterns and insights
-                            3. Data quality observations
-
-                            Keep it concise."""
-                
-                response = ollama.chat(
-                    model=self.current_model,
-                    messages=[{'role': 'user', 'content': prompt}]
-                )
+                    prompt = self.engine.summary_prompt(
+                        csv_data, self.csv_filename, self.csv_summary, self.embeddings_ready
+                    )
                 
-                answer = response['message']['content']
-                self.root.after(0, lambda: self.add_message("Bot", answer, "bot"))
-                self.root.after(0, lambda: self.update_status("✓ Ready"))
+                key = self.engine.response_key(csv_data, "summary", [prompt])
+                answer = self.engine.cached_response(key)
+                if answer is None:
+                    job.checkpoint()
+                    with self.stream_lock:
+                        answer = self.stream_chat([{'role': 'user', 'content': prompt}], job=job)
+                    self.engine.store_response(key, answer)
+                else:
+                    self.show_cached_answer(answer)
                 
             except Exception as e:
                 self.root.after(0, lambda: self.add_message("System", f"Error: {e}", "system"))
                 self.root.after(0, lambda: self.update_status("✗ Error"))
-            finally:
-                self.root.after(0, lambda: self.send_button.configure(state="normal"))
         
-        threading.Thread(target=analyze, daemon=True).start()
+        self.schedule(f"{mode} summary", analyze, SUMMARY, ('summary', csv_data.filepath, mode))
     
     def on_enter(self, event):
         if not event.state & 0x1:
@@ -351,67 +693,62 @@ class Summarizer:
         self.send_button.configure(state="disabled")
         self.update_status("Thinking...")
         
-        def get_response():
+        @metrics.profiled('question')
+        @metrics.timed('question')
+        def get_response(job):
             try:
-                # Use embeddings for retrieval if available
-                if self.embeddings_ready:
-                    relevant_chunks = self.csv_data.find_relevant_chunks(
-                        message, 
-                        self.embedding_model,
-                        top_k=3
-                    )
-                    context = "\n\n".join(relevant_chunks)
-                    context_info = f"Retrieved {len(relevant_chunks)} relevant data chunks"
-                else:
-                    # Fallback to sample
-                    context = json.dumps(self.csv_data.to_dict()[:5], indent=2)
-                    context_info = "Using sample data (generate embeddings for full access)"
-                
-                prompt = f"""CSV Dataset: {self.csv_filename}
-                            Total Rows: {len(self.csv_data.rows)}
-                            Columns: {', '.join(self.csv_data.headers)}
-
-                            Relevant Data:
-                            {context}
-
-                            Statistics:
-                            {self.csv_summary}
-
-                            Question: {message}
-
-                            Answer based on the data above. {context_info}."""
-                
-                self.conversation.append({'role': 'user', 'content': prompt})
-                
-                response = ollama.chat(
-                    model=self.current_model,
-                    messages=self.conversation
+                relevant_chunks, context_info = self.engine.question_chunks(
+                    self.csv_data, message, self.embeddings_ready
                 )
                 
-                answer = response['message']['content']
-                self.conversation.append({'role': 'assistant', 'content': answer})
-                
-                self.root.after(0, lambda: self.add_message("Bot", answer, "bot"))
-                self.root.after(0, lambda: self.update_status("✓ Ready"))
+                # Two questions may run at once; their turns must not interleave in the shared context
+                with self.turn_lock:
+                    # Earlier questions are part of the key so follow-ups are not answered out of context
+                    key = self.engine.response_key(
+                        self.csv_data, message, relevant_chunks, [q for q, _ in self.context.history]
+                    )
+                    
+                    # Only the plain question goes into history; chunks are deduplicated and budgeted
+                    with metrics.span('prompt.build'):
+                        messages = self.context.build_messages(message, relevant_chunks, context_info)
+                    answer = self.engine.cached_response(key)
+                    if answer is None:
+                        with self.stream_lock:
+                            answer = self.stream_chat(messages, options={'num_ctx': self.context.max_tokens}, job=job)
+                        self.engine.store_response(key, answer)
+                    else:
+                        self.show_cached_answer(answer)
+                    self.context.add_turn(message, answer)
                 
             except Exception as e:
                 self.root.after(0, lambda: self.add_message("System", f"Error: {e}", "system"))
                 self.root.after(0, lambda: self.update_status("✗ Error"))
-            finally:
-                self.root.after(0, lambda: self.send_button.configure(state="normal"))
         
-        threading.Thread(target=get_response, daemon=True).start()
+        # Re-enabled however the job ends, including when Stop cancels it while still queued
+        self.schedule("Question", get_response, INTERACTIVE, ('question', message),
+                      on_finished=lambda job: self.send_button.configure(state="normal"))
+    
+    def profile_next_question(self, event=None):
+        metrics.arm_profile()
+        self.add_message("System", "The next question or summary will be profiled with cProfile", "system")
+    
+    def toggle_cache(self):
+        self.engine.use_cache = self.cache_var.get()
+        state = "on" if self.engine.use_cache else "off (answers are always regenerated)"
+        self.add_message("System", f"Response cache {state}", "system")
     
     def change_model(self, choice):
-        self.current_model = choice
+        self.engine.model = choice
+        self.server.add_model(choice)
         self.add_message("System", f"Switched to {choice}", "system")
     
     def clear_chat(self):
-        self.conversation = []
+        self.context.clear()
         self.chat_display.delete("1.0", "end")
         self.add_message("System", "Chat cleared!", "system")
     
     def on_closing(self):
+        self.scheduler.shutdown()
         self.server.stop()
         self.root.destroy()
     
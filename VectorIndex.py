@@ -0,0 +1,222 @@
+from Imports import *
+
+
+def normalize(vectors):
+    """L2-normalize a vector or the rows of a matrix, leaving zero rows as zeros"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    if np.allclose(norms, 1, atol=1e-4):
+        return vectors  # Already normalized, avoid copying large matrices
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class ExactIndex:
+    """Brute-force inner-product search over normalized vectors"""
+    kind = 'exact'
+
+    def __init__(self):
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def build(self, vectors):
+        self.vectors = normalize(vectors)
+        return self
+
+    def add(self, vectors):
+        vectors = normalize(vectors)
+        self.vectors = vectors if len(self.vectors) == 0 else np.vstack([self.vectors, vectors])
+
+    def update(self, ids, vectors):
+        """Replace the vectors stored under existing ids"""
+        self.vectors = np.array(self.vectors, copy=True)
+        self.vectors[ids] = normalize(vectors)
+
+    def search(self, query, k=3):
+        """Return (ids, scores) of the k nearest vectors to a normalized query"""
+        scores = self.vectors @ query
+        ids = top_k_indices(scores, k)
+        return ids, scores[ids]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump({'kind': self.kind}, f)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+
+    @classmethod
+    def load(cls, path, params):
+        index = cls()
+        index.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+        return index
+
+    def snapshot(self):
+        return {'kind': self.kind}, {'vectors': self.vectors}
+
+    @classmethod
+    def from_snapshot(cls, params, arrays):
+        index = cls()
+        index.vectors = arrays['vectors']
+        return index
+
+
+class IVFIndex:
+    """Inverted-file index: spherical k-means lists, only nprobe lists scanned per query
+
+    Raising nprobe trades latency for recall; nprobe == nlist is an exact scan.
+    """
+    kind = 'ivf'
+
+    def __init__(self, nlist=None, nprobe=16, train_iters=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, vectors):
+        vectors = normalize(vectors)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        self.nlist = min(nlist, len(vectors)) or 1
+        self.centroids = self.train(vectors)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        self.add(vectors)
+        return self
+
+    def train(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        sample = vectors
+        if len(vectors) > 32 * self.nlist:
+            sample = vectors[rng.choice(len(vectors), 32 * self.nlist, replace=False)]
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+
+        for _ in range(self.train_iters):
+            assignment = self.assign(sample, centroids)
+            order = np.argsort(assignment, kind='stable')
+            counts = np.bincount(assignment, minlength=self.nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            used = counts > 0
+            sums = np.zeros_like(centroids)
+            sums[used] = np.add.reduceat(sample[order], starts[used], axis=0)
+            empty = ~used
+            # Re-seed empty lists with random points so every list stays in use
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids
+
+    @staticmethod
+    def assign(vectors, centroids, batch_size=65536):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            assignment[start:start+batch_size] = np.argmax(vectors[start:start+batch_size] @ centroids.T, axis=1)
+        return assignment
+
+    def add(self, vectors, ids=None):
+        """Insert vectors, by default with ids continuing after the current ones"""
+        vectors = normalize(vectors)
+        if ids is None:
+            next_id = int(self.ids.max()) + 1 if len(self.ids) else 0
+            new_ids = np.arange(next_id, next_id + len(vectors), dtype=np.int64)
+        else:
+            new_ids = np.asarray(ids, dtype=np.int64)
+        lists = np.concatenate([
+            np.repeat(np.arange(self.nlist), np.diff(self.offsets)),
+            self.assign(vectors, self.centroids)
+        ])
+        ids = np.concatenate([self.ids, new_ids])
+        all_vectors = np.vstack([self.vectors, vectors])
+
+        order = np.argsort(lists, kind='stable')
+        self.ids = ids[order]
+        self.vectors = np.ascontiguousarray(all_vectors[order])
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))])
+
+    def update(self, ids, vectors):
+        """Replace the vectors stored under existing ids, moving them to their new lists"""
+        keep = ~np.isin(self.ids, ids)
+        lists = np.repeat(np.arange(self.nlist), np.diff(self.offsets))[keep]
+        self.ids = self.ids[keep]
+        self.vectors = self.vectors[keep]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))])
+        self.add(vectors, ids)
+
+    def search(self, query, k=3, nprobe=None):
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        candidates = np.concatenate(
+            [np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes]
+        ) if len(probes) else np.empty(0, dtype=np.int64)
+        scores = self.vectors[candidates] @ query
+        best = top_k_indices(scores, k)
+        return self.ids[candidates[best]], scores[best]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump({'kind': self.kind, 'nlist': self.nlist, 'nprobe': self.nprobe,
+                       'train_iters': self.train_iters, 'seed': self.seed}, f)
+        for name in ('centroids', 'offsets', 'ids', 'vectors'):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, params):
+        index = cls(params['nlist'], params['nprobe'], params['train_iters'], params['seed'])
+        for name in ('centroids', 'offsets', 'ids', 'vectors'):
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        return index
+
+    def snapshot(self):
+        params = {'kind': self.kind, 'nlist': self.nlist, 'nprobe': self.nprobe,
+                  'train_iters': self.train_iters, 'seed': self.seed}
+        return params, {name: getattr(self, name) for name in ('centroids', 'offsets', 'ids', 'vectors')}
+
+    @classmethod
+    def from_snapshot(cls, params, arrays):
+        index = cls(params['nlist'], params['nprobe'], params['train_iters'], params['seed'])
+        for name in ('centroids', 'offsets', 'ids', 'vectors'):
+            setattr(index, name, arrays[name])
+        return index
+
+
+INDEX_TYPES = {ExactIndex.kind: ExactIndex, IVFIndex.kind: IVFIndex}
+IVF_THRESHOLD = 100000
+
+
+def create_index(kind='auto', num_vectors=0, **params):
+    """Pick an index implementation; 'auto' switches to IVF for large collections"""
+    if kind == 'auto':
+        kind = IVFIndex.kind if num_vectors >= IVF_THRESHOLD else ExactIndex.kind
+    if kind == ExactIndex.kind:
+        return ExactIndex()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {kind}")
+    return INDEX_TYPES[kind](**params)
+
+
+def load_index(path):
+    with open(os.path.join(path, "index.json"), 'r', encoding='utf-8') as f:
+        params = json.load(f)
+    return INDEX_TYPES[params['kind']].load(path, params)
+
+
+def index_from_snapshot(params, arrays):
+    return INDEX_TYPES[params['kind']].from_snapshot(params, arrays)
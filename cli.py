@@ -0,0 +1,111 @@
+from Imports import *
+from Engine import Engine
+from CSVParser import CSVParser
+from OllamaClient import OllamaClient
+from OllamaServer import OllamaServerPool
+from Metrics import metrics
+
+
+def collect_files(paths):
+    """Expand directories into the CSV files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith('.csv'))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize CSV files without the GUI")
+    parser.add_argument('paths', nargs='+', help="CSV files or directories of CSV files")
+    parser.add_argument('-o', '--output', default='-', help="JSONL output file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=2, help="files processed in parallel")
+    parser.add_argument('--parse-workers', type=int, help="processes parsing each file over 64 MB (default: CPU count)")
+    parser.add_argument('--embed-workers', type=int, default=4, help="concurrent embedding requests per file")
+    parser.add_argument('--model', default='gemma3:1b')
+    parser.add_argument('--embedding-model', default='nomic-embed-text')
+    parser.add_argument('--chunk-size', type=int, help="max rows per chunk (default: as many as fit in --chunk-tokens)")
+    parser.add_argument('--chunk-tokens', type=int, default=384, help="estimated token budget per chunk; 0 for fixed --chunk-size rows")
+    parser.add_argument('--chunk-encoding', default='csv', choices=CSVParser.CHUNK_ENCODINGS,
+                        help="row layout in chunks: csv/tsv state the header once, columns lists values per column")
+    parser.add_argument('--no-embed', action='store_true', help="summarize from sample rows without embeddings")
+    parser.add_argument('--full', action='store_true', help="map-reduce summary over every row (one model call per group of chunks)")
+    parser.add_argument('--summary-workers', type=int, default=2, help="concurrent model calls per file for --full")
+    parser.add_argument('--ollama', action='append', help="Ollama endpoint; repeat to balance load across servers")
+    parser.add_argument('--servers', type=int, default=0,
+                        help="start this many local Ollama servers on consecutive ports and balance across them")
+    parser.add_argument('--max-concurrency', type=int,
+                        help="concurrent requests across all endpoints (default: 8, or 8 per server with --servers)")
+    parser.add_argument('--metrics', help="write metrics here (.json snapshot with spans, otherwise Prometheus text)")
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--profile', metavar='DIR', help="cProfile the first file and save the stats to DIR")
+    parser.add_argument('--no-cache', action='store_true', help="always regenerate summaries instead of reusing cached ones")
+    parser.add_argument('--no-snapshot', action='store_true', help="always parse files instead of reopening session snapshots, and write none")
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_port is not None:
+        metrics.enable(path=args.metrics, port=args.metrics_port)
+    if args.profile:
+        metrics.arm_profile(args.profile)
+
+    pool = None
+    if args.servers:
+        pool = OllamaServerPool(
+            size=args.servers,
+            models=[args.model],
+            embedding_models=[] if args.no_embed else [args.embedding_model],
+            max_concurrency=args.max_concurrency
+        )
+        if not pool.start():
+            print("Could not start any Ollama server", file=sys.stderr)
+            sys.exit(1)
+    else:
+        OllamaClient.configure(endpoints=args.ollama, max_concurrency=args.max_concurrency or 8)
+    engine = Engine(
+        model=args.model,
+        embedding_model=args.embedding_model,
+        chunk_size=args.chunk_size,
+        chunk_tokens=args.chunk_tokens or None,
+        chunk_encoding=args.chunk_encoding,
+        embed_workers=args.embed_workers,
+        use_cache=not args.no_cache,
+        summary_workers=args.summary_workers,
+        parse_workers=args.parse_workers,
+        use_snapshots=not args.no_snapshot
+    )
+    files = collect_files(args.paths)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+
+    start = time.perf_counter()
+    stage_totals = {}
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = [executor.submit(engine.summarize_file, path, not args.no_embed, args.full) for path in files]
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                failures += 'error' in record
+                for stage, seconds in record['timings'].items():
+                    stage_totals[stage] = stage_totals.get(stage, 0) + seconds
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if pool is not None:
+            pool.stop()
+
+    wall = time.perf_counter() - start
+    stages = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in stage_totals.items())
+    cache = engine.response_cache.stats()
+    print(f"Processed {len(files)} files ({failures} failed) in {wall:.2f}s wall clock; "
+          f"summed stage times: {stages}; "
+          f"response cache hit rate {cache['response_hit_rate']:.0%} "
+          f"({cache['response_hits']}/{cache['response_hits'] + cache['response_misses']})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
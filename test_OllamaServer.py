@@ -0,0 +1,120 @@
+import socket
+
+import pytest
+
+from Imports import *
+from FakeOllama import FakeOllama
+from OllamaClient import OllamaClient
+from OllamaServer import OllamaServer, OllamaServerPool
+
+# `ollama serve` stand-in: FakeOllama.py listens on OLLAMA_HOST, which OllamaServer sets
+FAKE_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "FakeOllama.py")]
+
+
+def free_ports(count):
+    """First port of `count` consecutive free ports on localhost"""
+    for base in range(20000, 60000, 97):
+        sockets = []
+        try:
+            for port in range(base, base + count):
+                s = socket.socket()
+                sockets.append(s)
+                s.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+        finally:
+            for s in sockets:
+                s.close()
+    raise RuntimeError("no free ports")
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def loaded_models(address):
+    return {m['name'] for m in OllamaClient.shared().session.get(address + "/api/ps", timeout=2).json()['models']}
+
+
+@pytest.fixture(autouse=True)
+def fresh_client():
+    OllamaClient.configure(retries=0)
+    yield
+    OllamaClient.configure()
+
+
+@pytest.fixture
+def fake():
+    server = FakeOllama().start()
+    yield server
+    server.stop()
+
+
+def test_health_check(fake):
+    assert OllamaServer(fake.address).is_running()
+    assert not OllamaServer(f"http://127.0.0.1:{free_ports(1)}").is_running()
+
+
+def test_start_reuses_running_server(fake):
+    server = OllamaServer(fake.address, command=['false'])
+    assert server.start(timeout=2)
+    assert server.process is None
+
+
+def test_warm_up_preloads_models(fake):
+    pool = OllamaServerPool(address=fake.address, models=['chat-model'], embedding_models=['embed-model'])
+    pool.warm_up(pool.servers[0])
+    assert fake.loaded == {'chat-model', 'embed-model'}
+    assert fake.requests['/api/generate'] == 1
+    assert fake.requests['/api/embed'] == 1
+
+
+def test_pool_balances_and_sizes_concurrency():
+    base = free_ports(2)
+    fakes = [FakeOllama(port=base + i, latency=0.1).start() for i in range(2)]
+    # Both servers are already up, so the pool reuses them and only points the client at them
+    pool = OllamaServerPool(size=2, address=f"http://127.0.0.1:{base}", command=['false'], check_interval=60)
+    try:
+        assert pool.max_concurrency == 16
+        assert pool.start(timeout=2)
+        client = OllamaClient.shared()
+        assert client.endpoints == [fake.address for fake in fakes]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            replies = list(executor.map(lambda i: client.embed('embed-model', [f"text {i}"]), range(8)))
+        assert all(len(reply['embeddings']) == 1 for reply in replies)
+        counts = [fake.requests['/api/embed'] for fake in fakes]
+        assert sum(counts) == 8
+        assert all(count > 0 for count in counts)
+    finally:
+        pool.stop()
+        for fake in fakes:
+            fake.stop()
+
+
+def test_pool_starts_warms_and_restarts_crashed_server():
+    pool = OllamaServerPool(
+        size=2, address=f"http://127.0.0.1:{free_ports(2)}", models=['chat-model'],
+        embedding_models=['embed-model'], check_interval=0.2, command=FAKE_COMMAND
+    )
+    try:
+        assert pool.start(timeout=10)
+        assert OllamaClient.shared().endpoints == pool.addresses
+        for server in pool.servers:
+            assert wait_for(lambda: loaded_models(server.address) == {'chat-model', 'embed-model'})
+
+        crashed = pool.servers[0]
+        crashed.process.kill()
+        crashed.process.wait()
+        assert wait_for(lambda: crashed.restarts == 1 and crashed.is_alive())
+        # The restarted process starts empty; the monitor warms it up again
+        assert wait_for(lambda: loaded_models(crashed.address) == {'chat-model', 'embed-model'})
+        assert [s['alive'] for s in pool.status()] == [True, True]
+    finally:
+        pool.stop()
+    assert not any(server.is_running() for server in pool.servers)